@@ -3,20 +3,34 @@
 Handles all AI API calls for research and email generation using various providers.
 """
 
+import hashlib
 import json
+import threading
 import time
 import asyncio
 from datetime import datetime
-from typing import Dict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 from collections import deque
+import httpx
 import streamlit as st
-from tenacity import (retry, retry_if_exception_type, stop_after_attempt,
-                      wait_exponential, before_sleep_log)
+from tenacity import (retry, retry_if_exception_type, retry_if_not_exception_type,
+                      stop_after_attempt, wait_exponential, before_sleep_log)
 import litellm
 from litellm import completion
 from prompts import get_email_prompt, get_research_prompt
+from llm_cache import LLMCache
 import logging
 
+# Keep-alive connections shared by all Perplexity/OpenAI calls
+HTTP_POOL_SIZE = 50
+
+# Shortest sleep when a rate limit window is full, so waiters never spin
+MIN_RATE_LIMIT_WAIT = 0.05
+
+# OpenAI model name used in Batch API request bodies (no litellm provider prefix)
+EMAIL_BATCH_MODEL = "gpt-4o-mini"
+
 
 class RateLimiter:
     """Rate limiter for API calls with different limits per provider."""
@@ -34,11 +48,11 @@ class RateLimiter:
         self.perplexity_request_times = deque()
         
         self.logger = logging.getLogger("rate_limiter")
+        # Worker threads share the request windows; the lock is never held while sleeping
+        self._lock = threading.Lock()
     
-    def can_make_request(self, provider: str) -> bool:
-        """Check if we can make a request without hitting rate limits."""
-        current_time = time.time()
-        
+    def _window(self, provider: str) -> Tuple[deque, int]:
+        """Request timestamps and RPM limit for a provider, with entries older than a minute dropped."""
         if provider == "openai":
             request_times = self.openai_request_times
             rpm_limit = self.openai_rpm_limit
@@ -47,25 +61,60 @@ class RateLimiter:
             rpm_limit = self.perplexity_rpm_limit
         
         # Remove requests older than 1 minute
-        while request_times and current_time - request_times[0] > 60:
+        current_time = time.monotonic()
+        while request_times and current_time - request_times[0] >= 60:
             request_times.popleft()
         
-        return len(request_times) < rpm_limit
+        return request_times, rpm_limit
+    
+    def can_make_request(self, provider: str) -> bool:
+        """Check if we can make a request without hitting rate limits."""
+        with self._lock:
+            request_times, rpm_limit = self._window(provider)
+            return len(request_times) < rpm_limit
+    
+    def _seconds_until_free(self, provider: str, reserve: bool) -> float:
+        """Seconds until a request slot opens (0 if one is free now), optionally taking the slot."""
+        with self._lock:
+            request_times, rpm_limit = self._window(provider)
+            if len(request_times) < rpm_limit:
+                if reserve:
+                    request_times.append(time.monotonic())
+                return 0.0
+            # Full window: the next slot opens when the oldest request turns a minute old
+            return max(60 - (time.monotonic() - request_times[0]), MIN_RATE_LIMIT_WAIT)
     
     def wait_for_rate_limit(self, provider: str):
         """Wait until we can make a request within rate limits."""
-        while not self.can_make_request(provider):
-            self.logger.info(f"Rate limit reached for {provider}, waiting 1 second...")
-            time.sleep(1)
+        wait = self._seconds_until_free(provider, reserve=False)
+        while wait > 0:
+            self.logger.info(f"Rate limit reached for {provider}, waiting {wait:.1f} seconds...")
+            time.sleep(wait)
+            wait = self._seconds_until_free(provider, reserve=False)
+    
+    def acquire(self, provider: str):
+        """Wait for a free slot and record the request in it, atomically across threads."""
+        wait = self._seconds_until_free(provider, reserve=True)
+        while wait > 0:
+            self.logger.info(f"Rate limit reached for {provider}, waiting {wait:.1f} seconds...")
+            time.sleep(wait)
+            wait = self._seconds_until_free(provider, reserve=True)
     
     def record_request(self, provider: str):
         """Record that a request was made."""
-        current_time = time.time()
+        current_time = time.monotonic()
         
-        if provider == "openai":
-            self.openai_request_times.append(current_time)
-        else:  # perplexity
-            self.perplexity_request_times.append(current_time)
+        with self._lock:
+            if provider == "openai":
+                self.openai_request_times.append(current_time)
+            else:  # perplexity
+                self.perplexity_request_times.append(current_time)
+
+
+@st.cache_resource(show_spinner=False)
+def _llm_cache(path: str) -> LLMCache:
+    """One on-disk completion cache per file, shared across reruns and sessions."""
+    return LLMCache(Path(path))
 
 
 class AIService:
@@ -77,6 +126,17 @@ class AIService:
         openai_rpm_limit = getattr(config, 'openai_rpm_limit', 500)  # Default to 500 if not provided
         self.rate_limiter = RateLimiter(openai_rpm_limit=openai_rpm_limit)
         self.logger = logging.getLogger("ai_service")
+        
+        # Share one pooled HTTP client across all litellm calls so concurrent
+        # workers reuse TLS connections instead of handshaking per request
+        if litellm.client_session is None:
+            litellm.client_session = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE,
+                )
+            )
+        self.llm_cache = _llm_cache(str(config.llm_cache_path))
     
     def update_rate_limit(self, openai_rpm_limit: int):
         """Update the OpenAI rate limit configuration."""
@@ -103,6 +163,18 @@ class AIService:
         """Log retry attempts for debugging."""
         self.logger.warning(f"Retrying API call (attempt {retry_state.attempt_number}): {retry_state.outcome.exception()}")
     
+    def _research_messages(self, profile: Dict) -> List[Dict]:
+        """Build the chat messages for a research request."""
+        return [
+            {"role": "system", "content": "You are a helpful research assistant."},
+            {"role": "user", "content": get_research_prompt(profile)},
+        ]
+    
+    def research_prompt_key(self, profile: Dict) -> str:
+        """Digest of the messages research_call would send for this profile."""
+        messages = json.dumps(self._research_messages(profile), sort_keys=True)
+        return hashlib.blake2b(messages.encode(), digest_size=16).hexdigest()
+    
     @retry(
         stop=stop_after_attempt(5),  # Increased retry attempts
         wait=wait_exponential(multiplier=2, min=4, max=60),  # Longer waits for rate limits
@@ -110,21 +182,24 @@ class AIService:
         before_sleep=before_sleep_log(logging.getLogger("ai_service"), logging.WARNING),
         reraise=True
     )
-    def research_call(self, profile: Dict, api_key: str, max_tokens: int, timeout: int) -> str:
-        """Make research API call with rate limiting."""
-        # Wait for rate limit if necessary
-        self.rate_limiter.wait_for_rate_limit("perplexity")
+    def research_call(self, profile: Dict, api_key: str, max_tokens: int, timeout: int,
+                      use_cache: bool = False) -> str:
+        """Make research API call with rate limiting.
         
-        query = get_research_prompt(profile)
-        messages = [
-            {"role": "system", "content": "You are a helpful research assistant."},
-            {"role": "user", "content": query},
-        ]
+        With use_cache, an identical earlier request is answered from the LLM cache.
+        """
+        messages = self._research_messages(profile)
+        
+        cache_key = LLMCache.make_key("perplexity/sonar", messages, max_tokens) if use_cache else None
+        if cache_key:
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        # Wait for a free rate limit slot and claim it
+        self.rate_limiter.acquire("perplexity")
         
         try:
-            # Record the request
-            self.rate_limiter.record_request("perplexity")
-            
             resp = completion(
                 model="perplexity/sonar",
                 messages=messages,
@@ -135,7 +210,10 @@ class AIService:
             )
             
             self.save_api_response("perplexity", profile.get("name", ""), resp.to_dict())
-            return resp.choices[0].message.content
+            content = resp.choices[0].message.content
+            if cache_key:
+                self.llm_cache.set(cache_key, content)
+            return content
             
         except Exception as e:
             if self._is_rate_limit_error(e):
@@ -144,33 +222,50 @@ class AIService:
                 time.sleep(5)
             raise e
     
-    @retry(
-        stop=stop_after_attempt(5),  # Increased retry attempts
-        wait=wait_exponential(multiplier=2, min=4, max=60),  # Longer waits for rate limits
-        retry=retry_if_exception_type((Exception,)),
-        before_sleep=before_sleep_log(logging.getLogger("ai_service"), logging.WARNING),
-        reraise=True
-    )
-    def email_call(self, profile: Dict, api_key: str, max_tokens: int, timeout: int) -> str:
-        """Make email generation API call with rate limiting."""
-        # Wait for rate limit if necessary
-        self.rate_limiter.wait_for_rate_limit("openai")
-        
+    def _email_messages(self, profile: Dict) -> List[Dict]:
+        """Build the chat messages for an email draft, using the custom prompt if enabled."""
         # Get custom prompt from session state if enabled
         custom_prompt = None
         if hasattr(st, 'session_state') and st.session_state.get('use_custom_prompt', False):
             custom_prompt = st.session_state.get('custom_email_prompt')
         
         prompt = get_email_prompt(profile, custom_prompt)
-        messages = [
+        return [
             {"role": "system", "content": "You draft personalized outreach emails."},
             {"role": "user", "content": prompt},
         ]
+    
+    def email_prompt_key(self, profile: Dict) -> str:
+        """Digest of the messages email_call would send for this profile."""
+        messages = json.dumps(self._email_messages(profile), sort_keys=True)
+        return hashlib.blake2b(messages.encode(), digest_size=16).hexdigest()
+    
+    @retry(
+        stop=stop_after_attempt(5),  # Increased retry attempts
+        wait=wait_exponential(multiplier=2, min=4, max=60),  # Longer waits for rate limits
+        retry=retry_if_exception_type((Exception,)),
+        before_sleep=before_sleep_log(logging.getLogger("ai_service"), logging.WARNING),
+        reraise=True
+    )
+    def email_call(self, profile: Dict, api_key: str, max_tokens: int, timeout: int,
+                   use_cache: bool = False) -> str:
+        """Make email generation API call with rate limiting.
+        
+        With use_cache, an identical earlier request is answered from the LLM cache.
+        Regeneration leaves it off so it always gets a fresh draft.
+        """
+        messages = self._email_messages(profile)
+        
+        cache_key = LLMCache.make_key("openai/gpt-4o-mini", messages, max_tokens) if use_cache else None
+        if cache_key:
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        # Wait for a free rate limit slot and claim it
+        self.rate_limiter.acquire("openai")
         
         try:
-            # Record the request
-            self.rate_limiter.record_request("openai")
-            
             resp = completion(
                 model="openai/gpt-4o-mini",  # Using gpt-4o-mini for better rate limits
                 messages=messages,
@@ -181,11 +276,187 @@ class AIService:
             )
             
             self.save_api_response("openai", profile.get("name", ""), resp.to_dict())
-            return resp.choices[0].message.content
+            content = resp.choices[0].message.content
+            if cache_key:
+                self.llm_cache.set(cache_key, content)
+            return content
+            
+        except Exception as e:
+            if self._is_rate_limit_error(e):
+                self.logger.warning(f"Rate limit hit for OpenAI: {e}")
+                # Extra wait for rate limit errors
+                time.sleep(10)  # Longer wait for OpenAI rate limits
+            raise e 
+    
+    def email_stream(self, profile: Dict, api_key: str, max_tokens: int, timeout: int) -> Iterator[str]:
+        """Generate an email and yield it in pieces as the model produces them.
+        
+        Used where a single draft is shown live (st.write_stream). Opening the
+        stream is retried like email_call; a failure once text is flowing is not,
+        since it may already have been shown. The assembled reply is saved like
+        email_call's once the stream has been consumed.
+        """
+        messages = self._email_messages(profile)
+        resp = self._open_email_stream(messages, api_key, max_tokens, timeout)
+        
+        chunks = []
+        for chunk in resp:
+            chunks.append(chunk)
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+        
+        if chunks:
+            full_resp = litellm.stream_chunk_builder(chunks, messages=messages)
+            self.save_api_response("openai", profile.get("name", ""), full_resp.to_dict())
+    
+    @retry(
+        stop=stop_after_attempt(5),  # Increased retry attempts
+        wait=wait_exponential(multiplier=2, min=4, max=60),  # Longer waits for rate limits
+        retry=retry_if_exception_type((Exception,)),
+        before_sleep=before_sleep_log(logging.getLogger("ai_service"), logging.WARNING),
+        reraise=True
+    )
+    def _open_email_stream(self, messages: List[Dict], api_key: str, max_tokens: int, timeout: int):
+        """Start a streamed email completion for email_stream."""
+        # Wait for a free rate limit slot and claim it
+        self.rate_limiter.acquire("openai")
+        
+        try:
+            return completion(
+                model="openai/gpt-4o-mini",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                api_key=api_key,
+                timeout=timeout,
+                stream=True,
+            )
+        except Exception as e:
+            if self._is_rate_limit_error(e):
+                self.logger.warning(f"Rate limit hit for OpenAI: {e}")
+                # Extra wait for rate limit errors
+                time.sleep(10)  # Longer wait for OpenAI rate limits
+            raise e
+    
+    @retry(
+        stop=stop_after_attempt(5),  # Increased retry attempts
+        wait=wait_exponential(multiplier=2, min=4, max=60),  # Longer waits for rate limits
+        retry=retry_if_not_exception_type(ValueError),  # A malformed reply falls back to per-row calls
+        before_sleep=before_sleep_log(logging.getLogger("ai_service"), logging.WARNING),
+        reraise=True
+    )
+    def email_rows_call(self, profiles: List[Dict], api_key: str, max_tokens: int, timeout: int) -> List[str]:
+        """Generate emails for several profiles with a single API call.
+        
+        Each profile's usual email prompt is sent as a numbered request and the
+        model returns the drafts as a JSON array in the same order. max_tokens is
+        per email. Raises ValueError if the reply doesn't hold one draft per profile.
+        """
+        # Wait for a free rate limit slot and claim it
+        self.rate_limiter.acquire("openai")
+        
+        requests = "\n\n".join(
+            f"### Request {i}\n{self._email_messages(profile)[-1]['content']}"
+            for i, profile in enumerate(profiles, 1)
+        )
+        messages = [
+            {"role": "system", "content": "You draft personalized outreach emails."},
+            {"role": "user", "content": (
+                f"Below are {len(profiles)} separate email requests. Follow each one independently and "
+                f'reply with only a JSON object of the form {{"emails": [...]}} holding exactly '
+                f"{len(profiles)} email strings, in request order.\n\n{requests}"
+            )},
+        ]
+        
+        try:
+            resp = completion(
+                model="openai/gpt-4o-mini",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens * len(profiles),
+                api_key=api_key,
+                timeout=timeout,
+                response_format={"type": "json_object"},
+            )
+            
+            names = "+".join(profile.get("name", "") for profile in profiles)
+            self.save_api_response("openai", names[:100], resp.to_dict())
             
         except Exception as e:
             if self._is_rate_limit_error(e):
                 self.logger.warning(f"Rate limit hit for OpenAI: {e}")
                 # Extra wait for rate limit errors
                 time.sleep(10)  # Longer wait for OpenAI rate limits
-            raise e 
\ No newline at end of file
+            raise e
+        
+        try:
+            emails = json.loads(resp.choices[0].message.content)["emails"]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise ValueError(f"Could not parse batched email reply: {e}")
+        if not isinstance(emails, list) or len(emails) != len(profiles) or not all(isinstance(e, str) for e in emails):
+            raise ValueError(f"Expected {len(profiles)} emails in batched reply")
+        return emails
+    
+    def submit_email_batch(self, profiles: Dict, api_key: str, max_tokens: int) -> str:
+        """Submit email generation for several profiles as one OpenAI Batch API job.
+        
+        profiles maps a custom ID to profile data. Batch jobs cost half as much as
+        regular calls and don't count against the RPM limit, but can take up to 24h.
+        Returns the batch ID.
+        """
+        lines = []
+        for custom_id, profile in profiles.items():
+            lines.append(json.dumps({
+                "custom_id": str(custom_id),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": EMAIL_BATCH_MODEL,
+                    "messages": self._email_messages(profile),
+                    "temperature": 0.7,
+                    "max_tokens": max_tokens,
+                },
+            }))
+        
+        batch_file = litellm.create_file(
+            file=("email_batch.jsonl", "\n".join(lines).encode()),
+            purpose="batch",
+            custom_llm_provider="openai",
+            api_key=api_key,
+        )
+        batch = litellm.create_batch(
+            completion_window="24h",
+            endpoint="/v1/chat/completions",
+            input_file_id=batch_file.id,
+            custom_llm_provider="openai",
+            api_key=api_key,
+        )
+        self.logger.info(f"Submitted email batch {batch.id} with {len(lines)} requests")
+        return batch.id
+    
+    def get_email_batch(self, batch_id: str, api_key: str) -> Tuple[str, Optional[Dict[str, str]]]:
+        """Get the status of an email batch and, once completed, its drafts.
+        
+        Returns (status, results) where results maps custom ID -> email content for
+        every request that succeeded, or is None while the batch hasn't completed.
+        """
+        batch = litellm.retrieve_batch(batch_id=batch_id, custom_llm_provider="openai", api_key=api_key)
+        if batch.status != "completed":
+            return batch.status, None
+        
+        results = {}
+        if batch.output_file_id:
+            content = litellm.file_content(
+                file_id=batch.output_file_id, custom_llm_provider="openai", api_key=api_key
+            )
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+                else:
+                    self.logger.error(f"Batch request {record.get('custom_id')} failed: {record.get('error')}")
+        return batch.status, results
@@ -42,4 +42,8 @@ class ConfigManager:
     def responses_dir(self) -> Path:
         resp_dir = Path("responses")
         resp_dir.mkdir(exist_ok=True)
-        return resp_dir 
\ No newline at end of file
+        return resp_dir 
+    
+    @property
+    def llm_cache_path(self) -> Path:
+        return Path("llm_cache.sqlite")
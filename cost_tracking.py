@@ -4,6 +4,7 @@ Handles API cost tracking, estimation, and management.
 """
 
 import json
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Dict
@@ -16,6 +17,8 @@ class CostTracker:
     """Handles cost tracking for API calls."""
     
     def __init__(self):
+        # litellm runs success callbacks from worker threads, so updates are serialized
+        self._lock = threading.Lock()
         self.reset_tracking()
         
     def reset_tracking(self):
@@ -32,10 +35,15 @@ class CostTracker:
         cost = response.usage.get("cost", 0)
         tokens = response.usage.get("prompt_tokens", 0) + response.usage.get("completion_tokens", 0)
         
-        self.cost_data[provider]["calls"] += 1
-        self.cost_data[provider]["tokens"] += tokens
-        self.cost_data[provider]["cost"] += cost
-        self.total_cost += cost
+        with self._lock:
+            self.cost_data[provider]["calls"] += 1
+            self.cost_data[provider]["tokens"] += tokens
+            self.cost_data[provider]["cost"] += cost
+            self.total_cost += cost
+    
+    def total_calls(self) -> int:
+        """Total number of API calls across providers."""
+        return sum(data["calls"] for data in self.cost_data.values())
     
     def get_summary(self) -> Dict:
         """Get cost tracking summary."""
@@ -190,8 +198,9 @@ class CostEstimator:
             "breakdown": []
         }
         
-        for _, row in df.iterrows():
-            profile_costs = self.estimate_profile_cost(row.to_dict(), config)
+        # Plain dicts once up front instead of building a Series per row
+        for row in df.to_dict("records"):
+            profile_costs = self.estimate_profile_cost(row, config)
             
             # Aggregate costs
             for task in ["research", "email"]:
@@ -8,18 +8,37 @@ import os
 import base64
 import email.mime.text
 import logging
+import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 import pandas as pd
 import streamlit as st
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
+# Column names recognised as recipient email addresses, in order of preference
+EMAIL_FIELDS_ORDER = ('email', 'Email', 'email_address', 'Email_Address', 'contact_email', 'work_email')
+EMAIL_FIELDS = frozenset(EMAIL_FIELDS_ORDER)
+
+# Gmail recommends keeping batch requests to 50 calls or fewer
+GMAIL_BATCH_SIZE = 50
+
+# Times a rate-limited draft is resent, with exponential backoff (1s, 2s, 4s)
+GMAIL_MAX_RETRIES = 3
+
+
+def _is_rate_limited(result) -> bool:
+    """Whether a Gmail API result is an HttpError for a rate or concurrency limit."""
+    if not isinstance(result, HttpError):
+        return False
+    return result.resp.status == 429 or (result.resp.status == 403 and 'ratelimitexceeded' in str(result).lower())
+
 
 def get_google_credentials():
     """Get Google OAuth credentials from Streamlit secrets or local file."""
@@ -42,17 +61,50 @@ def get_google_credentials():
     except Exception as e:
         logger.warning(f"Could not load Streamlit secrets: {e}")
     
-    # Fallback to local credentials.json
-    if os.path.exists("credentials.json"):
-        try:
-            with open("credentials.json", 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Could not load credentials.json: {e}")
+    # Fallback to local credentials.json; a missing file just means there are none
+    try:
+        with open("credentials.json", 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Could not load credentials.json: {e}")
     
     return None
 
 
+def column_letter(col_idx: int) -> str:
+    """Convert a 0-based column index to its A1 column letters (0 -> A, 26 -> AA)."""
+    letters = ""
+    col_idx += 1
+    while col_idx:
+        col_idx, remainder = divmod(col_idx - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def a1_range(sheet_name: str, row_idx: int, start_col: int, end_col: Optional[int] = None) -> str:
+    """Build an A1 range for a single row using 0-based row and column indices.
+    
+    end_col is exclusive; when omitted the range covers just start_col.
+    """
+    quoted_name = "'" + sheet_name.replace("'", "''") + "'"
+    start = f"{column_letter(start_col)}{row_idx + 1}"
+    if end_col is None or end_col - start_col <= 1:
+        return f"{quoted_name}!{start}"
+    return f"{quoted_name}!{start}:{column_letter(end_col - 1)}{row_idx + 1}"
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _build_service(api: str, version: str, credentials_json: str, _credentials):
+    """Build a Google API client once per set of credentials.
+    
+    build() parses the API discovery document, so clients are cached as resources
+    keyed by the credentials' JSON; the credentials object itself is not hashed.
+    """
+    return build(api, version, credentials=_credentials, cache_discovery=False)
+
+
 class BaseGoogleService:
     """Base class for Google services with shared authentication."""
     
@@ -73,24 +125,29 @@ class BaseGoogleService:
                     st.session_state.google_credentials, self.config.scopes
                 )
                 
+                credentials_json = None
                 if self._credentials.expired and self._credentials.refresh_token:
                     self._credentials.refresh(Request())
-                    st.session_state.google_credentials = json.loads(self._credentials.to_json())
+                    credentials_json = self._credentials.to_json()
+                    st.session_state.google_credentials = json.loads(credentials_json)
                 
                 if self.required_scope in self._credentials.scopes:
-                    self._service = build(self.service_name.lower(), self.api_version, credentials=self._credentials)
+                    self._service = self._build_client(self.service_name.lower(), self.api_version, credentials_json)
                     return True
             
             if os.path.exists("token.json"):
                 self._credentials = Credentials.from_authorized_user_file("token.json", self.config.scopes)
                 
+                credentials_json = None
                 if self._credentials.expired and self._credentials.refresh_token:
                     self._credentials.refresh(Request())
-                    Path("token.json").write_text(self._credentials.to_json())
+                    credentials_json = self._credentials.to_json()
+                    Path("token.json").write_text(credentials_json)
                 
                 if self.required_scope in self._credentials.scopes:
-                    st.session_state.google_credentials = json.loads(self._credentials.to_json())
-                    self._service = build(self.service_name.lower(), self.api_version, credentials=self._credentials)
+                    credentials_json = credentials_json or self._credentials.to_json()
+                    st.session_state.google_credentials = json.loads(credentials_json)
+                    self._service = self._build_client(self.service_name.lower(), self.api_version, credentials_json)
                     return True
                 
             return False
@@ -99,6 +156,19 @@ class BaseGoogleService:
             logger.error(f"{self.service_name} authentication error: {e}")
             return False
     
+    def reset(self):
+        """Forget the current credentials and client, e.g. when the user signs out."""
+        self._service = None
+        self._credentials = None
+    
+    def _build_client(self, api: str, version: str, credentials_json: Optional[str] = None):
+        """Get a (cached) API client for the current credentials.
+        
+        Pass credentials_json when the caller has already serialized the credentials.
+        """
+        credentials_json = credentials_json or self._credentials.to_json()
+        return _build_service(api, version, credentials_json, self._credentials)
+    
     def get_service(self):
         """Get Google service."""
         if not self._service:
@@ -142,8 +212,9 @@ class BaseGoogleService:
             try:
                 flow.fetch_token(code=auth_code)
                 self._credentials = flow.credentials
-                st.session_state.google_credentials = json.loads(self._credentials.to_json())
-                self._service = build(self.service_name.lower(), self.api_version, credentials=self._credentials)
+                credentials_json = self._credentials.to_json()
+                st.session_state.google_credentials = json.loads(credentials_json)
+                self._service = self._build_client(self.service_name.lower(), self.api_version, credentials_json)
                 
                 st.query_params.clear()
                 # Mark OAuth flow as complete so the UI updates accordingly
@@ -164,9 +235,10 @@ class BaseGoogleService:
         """Handle OAuth for local development."""
         try:
             self._credentials = flow.run_local_server(port=0)
-            Path("token.json").write_text(self._credentials.to_json())
-            st.session_state.google_credentials = json.loads(self._credentials.to_json())
-            self._service = build(self.service_name.lower(), self.api_version, credentials=self._credentials)
+            credentials_json = self._credentials.to_json()
+            Path("token.json").write_text(credentials_json)
+            st.session_state.google_credentials = json.loads(credentials_json)
+            self._service = self._build_client(self.service_name.lower(), self.api_version, credentials_json)
             st.success("✅ Authentication successful!")
             return True
         except Exception as e:
@@ -210,7 +282,7 @@ class GoogleSheetsService(BaseGoogleService):
             return []
         
         try:
-            drive_service = build("drive", "v3", credentials=self._credentials)
+            drive_service = self._build_client("drive", "v3")
             results = drive_service.files().list(
                 q="mimeType='application/vnd.google-apps.spreadsheet'",
                 pageSize=100,
@@ -224,14 +296,27 @@ class GoogleSheetsService(BaseGoogleService):
             st.error(f"Error listing spreadsheets: {e}")
             return []
     
+    def get_spreadsheet_metadata(self, spreadsheet_id: str) -> Dict:
+        """Get the sheet properties of a spreadsheet, fetched once per session.
+        
+        Only sheetId/title/index are requested rather than the full spreadsheet
+        resource. Cleared by the Refresh Spreadsheets button.
+        """
+        cache_key = f"meta_{spreadsheet_id}"
+        if cache_key not in st.session_state:
+            service = self.get_service()
+            if not service:
+                return {}
+            st.session_state[cache_key] = service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id,
+                fields="sheets.properties(sheetId,title,index)"
+            ).execute()
+        return st.session_state[cache_key]
+    
     def list_sheets_in_spreadsheet(self, spreadsheet_id: str) -> List[Dict]:
         """List sheets within a spreadsheet."""
-        service = self.get_service()
-        if not service:
-            return []
-        
         try:
-            meta = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+            meta = self.get_spreadsheet_metadata(spreadsheet_id)
             sheets = []
             for sheet in meta.get("sheets", []):
                 properties = sheet["properties"]
@@ -288,15 +373,20 @@ class GoogleSheetsService(BaseGoogleService):
             for col in ["research", "draft"]:
                 if col not in df.columns:
                     df[col] = ""
-            return df
+            
+            # Arrow-backed strings use less memory and speed up notna()/str ops
+            return df.convert_dtypes(dtype_backend="pyarrow")
         except Exception as e:
             st.error(f"Error fetching profiles: {e}")
             return pd.DataFrame()
     
-    def batch_update_cells(self, spreadsheet_id: str, requests: List[Dict]):
-        """Update Google Sheets with batch requests."""
-        if not requests:
-            logger.warning("No requests provided for batch update")
+    def batch_update_values(self, spreadsheet_id: str, data: List[Dict]):
+        """Write string values to several ranges with one values.batchUpdate call.
+        
+        Each entry in data is {"range": <A1 range>, "values": [[...]]}.
+        """
+        if not data:
+            logger.warning("No data provided for batch update")
             return
             
         service = self.get_service()
@@ -305,13 +395,12 @@ class GoogleSheetsService(BaseGoogleService):
             return
             
         try:
-            response = service.spreadsheets().batchUpdate(
+            response = service.spreadsheets().values().batchUpdate(
                 spreadsheetId=spreadsheet_id, 
-                body={"requests": requests}
+                body={"valueInputOption": "RAW", "data": data}
             ).execute()
             
-            replies = response.get('replies', [])
-            logger.info(f"Successfully updated {len(replies)} cells")
+            logger.info(f"Successfully updated {response.get('totalUpdatedCells', 0)} cells")
             
         except Exception as e:
             logger.error(f"Error updating sheets: {e}")
@@ -331,48 +420,7 @@ class GmailService(BaseGoogleService):
             return None
         
         try:
-            # Extract recipient email
-            recipient_email = None
-            email_fields = ['email', 'Email', 'email_address', 'contact_email']
-            
-            for field in email_fields:
-                if field in profile and profile[field]:
-                    email_value = str(profile[field]).strip()
-                    if email_value and '@' in email_value and '.' in email_value:
-                        recipient_email = email_value
-                        break
-            
-            # Parse email content
-            lines = email_content.strip().split('\n')
-            subject_line = None
-            body_lines = []
-            
-            for i, line in enumerate(lines[:5]):
-                if line.lower().strip().startswith('subject:'):
-                    subject_line = line[8:].strip()
-                    body_lines = lines[i+1:]
-                    break
-            
-            if subject_line is None:
-                body_lines = lines
-                company_name = profile.get('company', profile.get('Company', 'Your Company'))
-                subject_line = f"Partnership Opportunity - {company_name}"
-            
-            if subject_prefix:
-                subject_line = f"{subject_prefix}{subject_line}"
-            
-            body = '\n'.join(line.strip() for line in body_lines if line.strip())
-            
-            # Create email message
-            message = email.mime.text.MIMEText(body)
-            message['Subject'] = subject_line
-            if recipient_email:
-                message['To'] = recipient_email
-            
-            # Create draft
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            draft_body = {'message': {'raw': raw_message}}
-            
+            draft_body, _ = self._build_draft_body(profile, email_content, subject_prefix)
             draft = service.users().drafts().create(userId='me', body=draft_body).execute()
             return draft.get('id')
             
@@ -380,6 +428,113 @@ class GmailService(BaseGoogleService):
             logger.error(f"Error creating Gmail draft: {e}")
             return None
     
+    def create_drafts_batch(self, drafts: List[Tuple[Dict, str]], subject_prefix: str = "",
+                            on_progress: Optional[Callable[[int], None]] = None) -> List:
+        """Create several Gmail drafts using batched HTTP requests.
+        
+        drafts is a list of (profile, email_content) pairs. Returns one
+        (result, subject) pair per draft: result is the new draft ID or the
+        exception that stopped it, and subject is the subject line the draft was
+        built with (None if it couldn't be built). Drafts rejected for rate limits
+        are retried with backoff. on_progress is called with the number of drafts
+        handled after each batch.
+        """
+        service = self.get_service()
+        if not service:
+            return [(RuntimeError("Could not get Gmail service"), None)] * len(drafts)
+        
+        results = [None] * len(drafts)
+        subjects = [None] * len(drafts)
+        
+        def on_done(request_id, response, exception):
+            if exception is not None:
+                logger.error(f"Error creating Gmail draft: {exception}")
+                results[int(request_id)] = exception
+            else:
+                results[int(request_id)] = response.get('id')
+        
+        for start in range(0, len(drafts), GMAIL_BATCH_SIZE):
+            chunk = drafts[start:start + GMAIL_BATCH_SIZE]
+            draft_bodies = {}
+            for i, (profile, email_content) in enumerate(chunk, start):
+                try:
+                    draft_bodies[i], subjects[i] = self._build_draft_body(profile, email_content, subject_prefix)
+                except Exception as e:
+                    logger.error(f"Error building Gmail draft: {e}")
+                    results[i] = e
+            
+            # Drafts that were rate limited are sent again in a smaller batch after a backoff
+            to_send = list(draft_bodies)
+            for attempt in range(GMAIL_MAX_RETRIES + 1):
+                batch = service.new_batch_http_request(callback=on_done)
+                for i in to_send:
+                    results[i] = None
+                    batch.add(service.users().drafts().create(userId='me', body=draft_bodies[i]),
+                              request_id=str(i))
+                
+                try:
+                    batch.execute()
+                except Exception as e:
+                    logger.error(f"Error executing Gmail draft batch: {e}")
+                    for i in to_send:
+                        if results[i] is None:
+                            results[i] = e
+                
+                to_send = [i for i in to_send if _is_rate_limited(results[i])]
+                if not to_send or attempt == GMAIL_MAX_RETRIES:
+                    break
+                logger.warning(f"{len(to_send)} Gmail drafts rate limited, retrying (attempt {attempt + 1})")
+                time.sleep(2 ** attempt)
+            
+            if on_progress:
+                on_progress(start + len(chunk))
+        
+        return list(zip(results, subjects))
+    
+    def _build_draft_body(self, profile: Dict, email_content: str, subject_prefix: str = "") -> Tuple[Dict, str]:
+        """Build the drafts.create request body for a profile's email.
+        
+        Returns (request body, subject line used).
+        """
+        # Extract recipient email
+        recipient_email = None
+        for field in EMAIL_FIELDS_ORDER:
+            if field in profile and profile[field]:
+                email_value = str(profile[field]).strip()
+                if email_value and '@' in email_value and '.' in email_value:
+                    recipient_email = email_value
+                    break
+        
+        # Parse email content
+        lines = email_content.strip().split('\n')
+        subject_line = None
+        body_lines = []
+        
+        for i, line in enumerate(lines[:5]):
+            if line.lower().strip().startswith('subject:'):
+                subject_line = line[8:].strip()
+                body_lines = lines[i+1:]
+                break
+        
+        if subject_line is None:
+            body_lines = lines
+            company_name = profile.get('company', profile.get('Company', 'Your Company'))
+            subject_line = f"Partnership Opportunity - {company_name}"
+        
+        if subject_prefix:
+            subject_line = f"{subject_prefix}{subject_line}"
+        
+        body = '\n'.join(line.strip() for line in body_lines if line.strip())
+        
+        # Create email message
+        message = email.mime.text.MIMEText(body)
+        message['Subject'] = subject_line
+        if recipient_email:
+            message['To'] = recipient_email
+        
+        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        return {'message': {'raw': raw_message}}, subject_line
+    
     def list_recent_drafts(self, max_results: int = 10) -> List[Dict]:
         """List recent drafts."""
         service = self.get_service()
@@ -390,32 +545,49 @@ class GmailService(BaseGoogleService):
             results = service.users().drafts().list(userId='me', maxResults=max_results).execute()
             drafts = results.get('drafts', [])
             
+            # Fetch the details of the first few drafts in one batched HTTP request
+            details = {}
+            
+            def on_detail(request_id, response, exception):
+                if exception is not None:
+                    logger.error(f"Error getting draft details: {exception}")
+                else:
+                    details[request_id] = response
+            
+            batch = service.new_batch_http_request(callback=on_detail)
+            for draft in drafts[:5]:
+                batch.add(
+                    service.users().drafts().get(userId='me', id=draft['id'], format='metadata'),
+                    request_id=draft['id']
+                )
+            if drafts:
+                batch.execute()
+            
             detailed_drafts = []
             for draft in drafts[:5]:
-                try:
-                    draft_detail = service.users().drafts().get(userId='me', id=draft['id']).execute()
-                    message = draft_detail.get('message', {})
-                    headers = message.get('payload', {}).get('headers', [])
-                    
-                    subject = "No Subject"
-                    for header in headers:
-                        if header['name'] == 'Subject':
-                            subject = header['value']
-                            break
-                    
-                    snippet = message.get('snippet', '')
-                    if len(snippet) > 100:
-                        snippet = snippet[:100] + "..."
-                    
-                    detailed_drafts.append({
-                        'id': draft['id'],
-                        'subject': subject,
-                        'snippet': snippet,
-                        'created': draft_detail.get('message', {}).get('internalDate', '')
-                    })
-                except Exception as e:
-                    logger.error(f"Error getting draft details: {e}")
+                draft_detail = details.get(draft['id'])
+                if draft_detail is None:
                     continue
+                
+                message = draft_detail.get('message', {})
+                headers = message.get('payload', {}).get('headers', [])
+                
+                subject = "No Subject"
+                for header in headers:
+                    if header['name'] == 'Subject':
+                        subject = header['value']
+                        break
+                
+                snippet = message.get('snippet', '')
+                if len(snippet) > 100:
+                    snippet = snippet[:100] + "..."
+                
+                detailed_drafts.append({
+                    'id': draft['id'],
+                    'subject': subject,
+                    'snippet': snippet,
+                    'created': message.get('internalDate', '')
+                })
             
             return detailed_drafts
             
@@ -0,0 +1,63 @@
+"""LLM Response Cache for LinkedIn Research Pipeline
+===============================================
+Persists LLM completions on disk so re-running unchanged profiles doesn't pay
+for the same research or email twice.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# Cached completions older than this are ignored and refetched
+CACHE_TTL_DAYS = 30
+
+
+class LLMCache:
+    """SQLite-backed cache of LLM completions keyed by a hash of the request."""
+
+    def __init__(self, path: Path, ttl_days: int = CACHE_TTL_DAYS):
+        self.path = path
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        # One connection is shared by the worker threads, so access is serialized
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """SHA256 of the request parts (model, messages, sampling settings...)."""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached completion for key, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM completions WHERE key = ? AND created > ?",
+                (key, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, response: str):
+        """Store a completion, replacing any older entry for the same key."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, created) VALUES (?, ?, ?)",
+                (key, response, time.time())
+            )
+            self._conn.commit()
+
+    def clear(self) -> int:
+        """Remove every cached completion and return how many there were."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM completions").rowcount
+            self._conn.commit()
+        return removed
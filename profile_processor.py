@@ -4,12 +4,88 @@ Handles the main profile processing logic including concurrent processing,
 real-time updates, and email regeneration.
 """
 
+import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 import concurrent.futures as cf
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from google_services import a1_range
+
+# Minimum seconds between progress/results redraws while processing
+UI_UPDATE_INTERVAL = 0.5
+
+# Pending cell writes that trigger a mid-run flush to Google Sheets
+# (override with config['sheets_batch_size'])
+SHEETS_BATCH_SIZE = 100
+
+# OpenAI Batch API statuses after which a batch will not change any more
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Task type for rows that get research and an email draft in one chained call
+RESEARCH_AND_DRAFT = "research+draft"
+
+# Task type for several draft-only rows sent to the model in one call
+# (config['email_rows_per_call'] > 1)
+DRAFT_ROWS = "draft rows"
+
+
+def _is_blank(series: pd.Series) -> pd.Series:
+    """Boolean mask of cells that are missing or empty strings."""
+    return series.isna() | (series.astype(str) == "")
+
+
+@contextmanager
+def _executor(max_workers: int, stop_event: Optional[threading.Event] = None) -> Iterator[cf.ThreadPoolExecutor]:
+    """Thread pool whose workers share the current script run context.
+    
+    Workers read settings such as the custom email prompt from st.session_state,
+    which is only visible to threads attached to the script run.
+    
+    If the block raises, including Streamlit interrupting the run, stop_event is
+    set. Once stop_event is set, queued tasks are cancelled and running ones are
+    left to finish in the background instead of being waited for.
+    """
+    ctx = get_script_run_ctx()
+    executor = cf.ThreadPoolExecutor(max_workers=max_workers, initializer=lambda: add_script_run_ctx(ctx=ctx))
+    try:
+        yield executor
+    except BaseException:
+        if stop_event is not None:
+            stop_event.set()
+        raise
+    finally:
+        stopped = stop_event is not None and stop_event.is_set()
+        executor.shutdown(wait=not stopped, cancel_futures=stopped)
+
+
+def _coalesce_cell_updates(sheet_name: str, cell_updates: List[Tuple[int, int, str]]) -> List[Dict]:
+    """Turn pending (sheet_row, col, value) writes into values.batchUpdate ranges.
+    
+    Research and draft results for the same row usually land in the same flush, so
+    writes to contiguous columns of a row are merged into a single range.
+    """
+    by_row = {}
+    for sheet_row, col_idx, value in cell_updates:
+        by_row.setdefault(sheet_row, []).append((col_idx, value))
+    
+    data = []
+    for sheet_row, cells in by_row.items():
+        cells.sort(key=lambda cell: cell[0])
+        start_col, values = cells[0][0], [cells[0][1]]
+        for col_idx, value in cells[1:]:
+            if col_idx == start_col + len(values):
+                values.append(value)
+            else:
+                data.append({"range": a1_range(sheet_name, sheet_row, start_col, start_col + len(values)),
+                             "values": [values]})
+                start_col, values = col_idx, [value]
+        data.append({"range": a1_range(sheet_name, sheet_row, start_col, start_col + len(values)),
+                     "values": [values]})
+    return data
 
 
 class ProfileProcessor:
@@ -21,138 +97,190 @@ class ProfileProcessor:
         self.cost_tracker = cost_tracker
     
     def process_profiles(self, df: pd.DataFrame, config: Dict, 
-                        progress_bar, status_text, results_container) -> pd.DataFrame:
-        """Process profiles with real-time updates."""
-        sheet_id = self.sheets_service.get_sheet_id_by_name(config['spreadsheet_id'], config['sheet_name'])
+                        progress_bar, status_text, results_container,
+                        stop_event: Optional[threading.Event] = None) -> pd.DataFrame:
+        """Process profiles with real-time updates.
+        
+        Setting stop_event ends the run early: tasks not yet started are cancelled
+        and the results that have finished are still written to the sheet. Streamlit
+        interrupting the run (the Stop button's rerun) sets it too.
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        # Shallow copy with its own research/draft columns, so writes below never
+        # reach the caller's frame whether or not copy-on-write is enabled
+        df = df.copy(deep=False)
+        df["research"] = df["research"].copy()
+        df["draft"] = df["draft"].copy()
         research_col = df.columns.get_loc("research")
         draft_col = df.columns.get_loc("draft")
-        update_requests = []
+        cell_updates = []
+        sheets_batch_size = config.get('sheets_batch_size', SHEETS_BATCH_SIZE)
         
         total_profiles = len(df)
         processed = 0
         failed_tasks = 0
+        last_ui_update = time.monotonic()
         
-        with cf.ThreadPoolExecutor(max_workers=config['max_workers']) as executor:
-            future_to_profile = {}
+        try:
+            with _executor(config['max_workers'], stop_event) as executor:
+                future_to_profile = {}
+            
+                # Work out which rows need which tasks in one vectorized pass
+                needs_research = _is_blank(df["research"])
+                needs_draft = _is_blank(df["draft"])
+                if config.get('use_batch_api'):
+                    # Drafts are queued as one Batch API job once research is done
+                    needs_draft = pd.Series(False, index=df.index)
+                columns = list(df.columns)
+            
+                # Research-only rows with the same research prompt share one call; later
+                # rows are recorded against the first and get its result
+                research_leaders = {}
+                duplicate_rows = {}
             
-            # Submit research tasks for rows without research
-            for idx, row in df.iterrows():
-                if not row["research"]:
+                # Submit research tasks for rows without research. Rows that also need a
+                # draft run research and email back-to-back in a single task.
+                for idx, *values in df.loc[needs_research & ~needs_draft].itertuples(name=None):
+                    row = dict(zip(columns, values))
+                    leader = research_leaders.setdefault(self._research_key(row, idx), idx)
+                    if leader != idx:
+                        duplicate_rows.setdefault(leader, []).append(idx)
+                        continue
                     future = executor.submit(
                         self.ai_service.research_call, 
-                        row.to_dict(), 
+                        row, 
                         config['perplexity_api_key'],
                         config['research_max_tokens'],
-                        config['timeout_seconds']
+                        config['timeout_seconds'],
+                        use_cache=config.get('use_llm_cache', False)
                     )
-                    future_to_profile[future] = (idx, "research", row)
+                    future_to_profile[future] = (idx, "research", row.get('name', f'Row {idx}'))
+            
+                # Rows that also need a draft are grouped by research prompt: the group
+                # shares one research call, but each row gets its own email, since the
+                # email prompt uses fields (email, topic, ...) the research prompt doesn't
+                research_groups = {}
+                for idx, *values in df.loc[needs_research & needs_draft].itertuples(name=None):
+                    row = dict(zip(columns, values))
+                    research_groups.setdefault(self._research_key(row, idx), []).append((idx, row))
+                for group in research_groups.values():
+                    future = executor.submit(self._research_then_email, [row for _, row in group], config)
+                    future_to_profile[future] = ([idx for idx, _ in group], RESEARCH_AND_DRAFT,
+                                                 [row.get('name', f'Row {idx}') for idx, row in group])
             
-            # Submit email tasks for rows that already have research but no draft
-            for idx, row in df.iterrows():
-                if row["research"] and not row["draft"]:
+                # Submit email tasks for rows that already have research but no draft,
+                # packing rows_per_call of them into each request when enabled
+                rows_per_call = config.get('email_rows_per_call', 1)
+                draft_rows = list(df.loc[~needs_research & needs_draft].itertuples(name=None))
+                for start in range(0, len(draft_rows), rows_per_call):
+                    chunk = [(idx, dict(zip(columns, values))) for idx, *values in draft_rows[start:start + rows_per_call]]
+                    if len(chunk) > 1:
+                        future = executor.submit(self._email_rows, [row for _, row in chunk], config)
+                        future_to_profile[future] = ([idx for idx, _ in chunk], DRAFT_ROWS,
+                                                     [row.get('name', f'Row {idx}') for idx, row in chunk])
+                        continue
+                
+                    idx, row = chunk[0]
                     future = executor.submit(
                         self.ai_service.email_call,
-                        row.to_dict(),
+                        row,
                         config['openai_api_key'],
                         config['email_max_tokens'],
-                        config['timeout_seconds']
+                        config['timeout_seconds'],
+                        use_cache=config.get('use_llm_cache', False)
                     )
-                    future_to_profile[future] = (idx, "draft", row)
+                    future_to_profile[future] = (idx, "draft", row.get('name', f'Row {idx}'))
             
-            # Process completed tasks with improved error handling
-            while future_to_profile:
-                try:
-                    # Use a longer timeout to avoid frequent timeouts
-                    done_futures = list(cf.as_completed(future_to_profile, timeout=5))
-                    
-                    for future in done_futures:
-                        if future in future_to_profile:
-                            idx, task_type, row = future_to_profile.pop(future)
-                            try:
-                                result = future.result()
-                                df.at[idx, task_type] = result
-                                
-                                # Track newly processed items
-                                st.session_state.newly_processed.add((idx, task_type))
+                # Process completed tasks with improved error handling
+                while future_to_profile and not stop_event.is_set():
+                    try:
+                        # Handle each future as soon as it completes
+                        for future in cf.as_completed(future_to_profile, timeout=5):
+                            if future in future_to_profile:
+                                # Only the row index and name are kept per task so pending
+                                # futures don't hold on to whole profile records
+                                idx, task_type, profile_name = future_to_profile.pop(future)
+                                try:
+                                    if task_type == RESEARCH_AND_DRAFT:
+                                        research, drafts = future.result()
+                                        outcomes = [outcome
+                                                    for row_idx, name, draft in zip(idx, profile_name, drafts)
+                                                    for outcome in ((row_idx, name, "research", research),
+                                                                    (row_idx, name, "draft", draft))]
+                                    elif task_type == DRAFT_ROWS:
+                                        outcomes = [(row_idx, name, "draft", draft)
+                                                    for row_idx, name, draft in zip(idx, profile_name, future.result())]
+                                    else:
+                                        outcomes = [(idx, profile_name, task_type, future.result())]
+                                except Exception as e:
+                                    if task_type == DRAFT_ROWS:
+                                        outcomes = [(row_idx, name, "draft", e) for row_idx, name in zip(idx, profile_name)]
+                                    elif task_type == RESEARCH_AND_DRAFT:
+                                        outcomes = [(row_idx, name, task_type, e) for row_idx, name in zip(idx, profile_name)]
+                                    else:
+                                        outcomes = [(idx, profile_name, task_type, e)]
+                            
+                                # Duplicate rows take the same outcome as the row that was sent
+                                outcomes += [(row_idx, name, outcome_type, result)
+                                             for outcome_idx, name, outcome_type, result in outcomes
+                                             for row_idx in duplicate_rows.get(outcome_idx, ())]
+                            
+                                for idx, profile_name, outcome_type, result in outcomes:
+                                    if isinstance(result, Exception):
+                                        failed_tasks += 1
+                                        error_msg = f"Error processing {profile_name}: {str(result)}"
+                                        st.error(error_msg)
+                                        self.ai_service.config.logger.error(error_msg)
+                                    else:
+                                        col_idx = research_col if outcome_type == "research" else draft_col
+                                        self._record_result(df, idx, outcome_type, result, profile_name,
+                                                            col_idx, cell_updates)
                                 
-                                # Store session results
-                                profile_name = row.get('name', f'Row {idx}')
-                                result_entry = {
-                                    'name': profile_name,
-                                    'task': task_type,
-                                    'content': result[:200] + "..." if len(result) > 200 else result,
-                                    'timestamp': datetime.utcnow().strftime("%H:%M:%S")
-                                }
-                                st.session_state.session_results.append(result_entry)
-                                
-                                # Update Google Sheets
-                                col_idx = research_col if task_type == "research" else draft_col
-                                update_requests.append({
-                                    "updateCells": {
-                                        "range": {
-                                            "sheetId": sheet_id,
-                                            "startRowIndex": idx + 1,
-                                            "endRowIndex": idx + 2,
-                                            "startColumnIndex": col_idx,
-                                            "endColumnIndex": col_idx + 1,
-                                        },
-                                        "rows": [{"values": [{"userEnteredValue": {"stringValue": result}}]}],
-                                        "fields": "userEnteredValue",
-                                    }
-                                })
-                                
-                                # Submit email task if research completed and no draft exists
-                                if task_type == "research" and not df.at[idx, "draft"]:
-                                    email_future = executor.submit(
-                                        self.ai_service.email_call,
-                                        df.loc[idx].to_dict(),
-                                        config['openai_api_key'],
-                                        config['email_max_tokens'],
-                                        config['timeout_seconds']
-                                    )
-                                    future_to_profile[email_future] = (idx, "draft", df.loc[idx])
-                                
-                                processed += 1
-                                progress = processed / (total_profiles * 2)  # research + email
-                                progress_bar.progress(min(progress, 1.0))
-                                status_text.text(f"Processed {processed} tasks... ({failed_tasks} failed)")
-                                
-                                # Update results display
-                                self._update_results_display(df, results_container)
-                                
-                            except Exception as e:
-                                failed_tasks += 1
-                                error_msg = f"Error processing {row.get('name', 'unknown')}: {str(e)}"
-                                st.error(error_msg)
-                                self.ai_service.config.logger.error(error_msg)
-                                
-                                # Still count as processed for progress
-                                processed += 1
-                                progress = processed / (total_profiles * 2)
-                                progress_bar.progress(min(progress, 1.0))
-                                status_text.text(f"Processed {processed} tasks... ({failed_tasks} failed)")
+                                    # Failed tasks still count as processed for progress
+                                    processed += 1
+                            
+                                # Flush to Google Sheets in batches so long runs save as they go
+                                if len(cell_updates) >= sheets_batch_size:
+                                    self._flush_cell_updates(config, cell_updates)
+                            
+                                # Throttle UI updates - each one is a round-trip to the browser
+                                if time.monotonic() - last_ui_update > UI_UPDATE_INTERVAL:
+                                    self._update_progress(progress_bar, status_text, processed, failed_tasks, total_profiles)
+                                    self._update_results_display(df, results_container)
+                                    last_ui_update = time.monotonic()
+                            
+                            if stop_event.is_set():
+                                break
                 
-                except cf.TimeoutError:
-                    # Handle timeout gracefully - continue waiting for remaining futures
-                    if future_to_profile:
-                        status_text.text(f"Waiting for {len(future_to_profile)} remaining tasks... ({processed} completed, {failed_tasks} failed)")
-                        continue
-                    else:
-                        break
+                    except cf.TimeoutError:
+                        # Handle timeout gracefully - continue waiting for remaining futures
+                        if future_to_profile:
+                            status_text.text(f"Waiting for {len(future_to_profile)} remaining tasks... ({processed} completed, {failed_tasks} failed)")
+                            continue
+                        else:
+                            break
                         
-                except Exception as e:
-                    # Handle any other unexpected errors
-                    st.error(f"Unexpected error in processing loop: {str(e)}")
-                    self.ai_service.config.logger.error(f"Processing loop error: {e}")
-                    break
+                    except Exception as e:
+                        # Handle any other unexpected errors
+                        st.error(f"Unexpected error in processing loop: {str(e)}")
+                        self.ai_service.config.logger.error(f"Processing loop error: {e}")
+                        break
+        except BaseException:
+            # Interrupted (e.g. Stop was clicked): save what has finished before
+            # letting the interruption through
+            self._flush_cell_updates(config, cell_updates)
+            raise
+        
+        # Final UI update so the last results are always shown
+        self._update_progress(progress_bar, status_text, processed, failed_tasks, total_profiles)
+        self._update_results_display(df, results_container)
         
         # Final batch update
-        if update_requests:
-            try:
-                self.sheets_service.batch_update_cells(config['spreadsheet_id'], update_requests)
-            except Exception as e:
-                st.error(f"Error updating Google Sheets: {str(e)}")
-                self.ai_service.config.logger.error(f"Sheets update error: {e}")
+        self._flush_cell_updates(config, cell_updates)
+        
+        if config.get('use_batch_api'):
+            self._submit_draft_batch(df, config)
         
         # Final status update
         if failed_tasks > 0:
@@ -160,64 +288,288 @@ class ProfileProcessor:
         
         return df
     
+    def _flush_cell_updates(self, config: Dict, cell_updates: List[Tuple[int, int, str]]):
+        """Write pending cell updates with one values.batchUpdate call and clear the buffer."""
+        if not cell_updates:
+            return
+        
+        try:
+            self.sheets_service.batch_update_values(
+                config['spreadsheet_id'], _coalesce_cell_updates(config['sheet_name'], cell_updates)
+            )
+        except Exception as e:
+            st.error(f"Error updating Google Sheets: {str(e)}")
+            self.ai_service.config.logger.error(f"Sheets update error: {e}")
+        cell_updates.clear()
+    
+    def _research_key(self, row: Dict, idx) -> str:
+        """Research prompt digest for a row; rows whose prompt can't be built get a key of their own."""
+        try:
+            return self.ai_service.research_prompt_key(row)
+        except Exception:
+            return f"row-{idx}"  # Let research_call report the error for this row on its own
+    
+    def _submit_draft_batch(self, df: pd.DataFrame, config: Dict):
+        """Queue every row that has research but no draft as one Batch API job."""
+        pending = df.loc[_is_blank(df["draft"]) & ~_is_blank(df["research"])]
+        if pending.empty:
+            return
+        
+        try:
+            batch_id = self.submit_regeneration_batch(pending.drop(columns="draft").to_dict("index"), config)
+            st.info(f"📨 Submitted batch `{batch_id}` for {len(pending)} email drafts. "
+                    "Apply it from the Email Management tab once it finishes.")
+        except Exception as e:
+            st.error(f"Error submitting email batch: {str(e)}")
+            self.ai_service.config.logger.error(f"Email batch submission error: {e}")
+    
+    def _research_then_email(self, profiles: List[Dict], config: Dict):
+        """Run research once and then email generation for each profile in a single task.
+        
+        profiles all share the same research prompt. Returns (research, drafts) with
+        one draft per profile; if a profile's email generation fails the research is
+        kept and the exception is returned in place of its draft.
+        """
+        research = self.ai_service.research_call(
+            profiles[0],
+            config['perplexity_api_key'],
+            config['research_max_tokens'],
+            config['timeout_seconds'],
+            use_cache=config.get('use_llm_cache', False)
+        )
+        drafts = []
+        for profile in profiles:
+            try:
+                drafts.append(self.ai_service.email_call(
+                    {**profile, "research": research},
+                    config['openai_api_key'],
+                    config['email_max_tokens'],
+                    config['timeout_seconds'],
+                    use_cache=config.get('use_llm_cache', False)
+                ))
+            except Exception as e:
+                drafts.append(e)
+        return research, drafts
+    
+    def _email_rows(self, profiles: List[Dict], config: Dict) -> List:
+        """Generate drafts for several profiles in one API call.
+        
+        Returns a draft or exception per profile. If the model's reply can't be
+        matched back to the profiles, each one is retried with its own call.
+        """
+        try:
+            return self.ai_service.email_rows_call(
+                profiles,
+                config['openai_api_key'],
+                config['email_max_tokens'],
+                config['timeout_seconds']
+            )
+        except ValueError as e:
+            self.ai_service.config.logger.warning(f"Falling back to one email call per profile: {e}")
+        
+        drafts = []
+        for profile in profiles:
+            try:
+                drafts.append(self.ai_service.email_call(
+                    profile,
+                    config['openai_api_key'],
+                    config['email_max_tokens'],
+                    config['timeout_seconds'],
+                    use_cache=config.get('use_llm_cache', False)
+                ))
+            except Exception as e:
+                drafts.append(e)
+        return drafts
+    
+    def _record_result(self, df: pd.DataFrame, idx, task_type: str, result: str, profile_name: str,
+                       col_idx: int, cell_updates: List[Tuple[int, int, str]]):
+        """Store a completed task in the dataframe, session results and pending sheet updates."""
+        df.at[idx, task_type] = result
+        
+        # Store session results
+        st.session_state.session_results.append({
+            'name': profile_name,
+            'task': task_type,
+            'content': result[:200] + "..." if len(result) > 200 else result,
+            'timestamp': datetime.utcnow().strftime("%H:%M:%S")
+        })
+        
+        # Queue the Google Sheets write; row 0 of the sheet is the header
+        cell_updates.append((idx + 1, col_idx, result))
+    
+    def _update_progress(self, progress_bar, status_text, processed: int, failed_tasks: int, total_profiles: int):
+        """Update the progress bar and status text."""
+        progress = processed / (total_profiles * 2)  # research + email
+        progress_bar.progress(min(progress, 1.0))
+        status_text.text(f"Processed {processed} tasks... ({failed_tasks} failed)")
+    
     def _update_results_display(self, df: pd.DataFrame, results_container):
         """Update the live results display."""
-        # Clear the container and redraw all content
-        results_container.empty()
-        
-        # Show session results table directly in the cleared container
+        # results_container is an st.empty() placeholder; writing the table straight
+        # into it swaps the previous table in place with a single update
         if st.session_state.session_results:
-            with results_container:
-                st.subheader("✨ New Results This Session")
-                results_table_df = pd.DataFrame(st.session_state.session_results)
+            # st.dataframe takes the list of dicts directly, so there is no
+            # need to build an intermediate DataFrame on every redraw
+            results_container.dataframe(
+                st.session_state.session_results,
+                column_config={
+                    "name": "Profile",
+                    "task": "Task",
+                    "content": st.column_config.TextColumn("Content Preview", width="large"),
+                    "timestamp": "Time"
+                },
+                use_container_width=True,
+                hide_index=True
+            )
+
+    def regenerate_emails(self, profiles: Dict, config: Dict, on_progress=None) -> Dict:
+        """Regenerate emails for several profiles concurrently.
+        
+        profiles maps dataframe index -> profile data. Returns index -> new email,
+        or the exception raised for that profile. on_progress is called with the
+        number of finished profiles. Profiles that would send an identical prompt
+        share one API call. Sheet writes go out in one batch at the end.
+        """
+        results = {}
+        cell_updates = []
+        draft_col = st.session_state.profiles_df.columns.get_loc("draft")
+        
+        # Group indices by prompt so duplicate rows cost a single call
+        prompt_groups = {}
+        for idx, profile_data in profiles.items():
+            try:
+                key = self.ai_service.email_prompt_key(profile_data)
+            except Exception:
+                key = idx  # Let email_call report the error for this profile on its own
+            prompt_groups.setdefault(key, []).append(idx)
+        
+        with _executor(config['max_workers']) as executor:
+            future_to_indices = {
+                executor.submit(
+                    self.ai_service.email_call,
+                    profiles[indices[0]],
+                    config['openai_api_key'],
+                    config['email_max_tokens'],
+                    config['timeout_seconds']
+                ): indices
+                for indices in prompt_groups.values()
+            }
+            
+            # Results are applied here on the script thread as each call finishes
+            for future in cf.as_completed(future_to_indices):
+                indices = future_to_indices[future]
+                try:
+                    new_email = future.result()
+                except Exception as e:
+                    self.ai_service.config.logger.error(f"Error regenerating email for profiles at indices {indices}: {e}")
+                    results.update(dict.fromkeys(indices, e))
+                else:
+                    for idx in indices:
+                        st.session_state.profiles_df.at[idx, 'draft'] = new_email
+                        cell_updates.append((idx + 1, draft_col, new_email))
+                    results.update(dict.fromkeys(indices, new_email))
                 
-                # Style the results table
-                st.dataframe(
-                    results_table_df,
-                    column_config={
-                        "name": "Profile",
-                        "task": "Task",
-                        "content": st.column_config.TextColumn("Content Preview", width="large"),
-                        "timestamp": "Time"
-                    },
-                    use_container_width=True,
-                    hide_index=True
+                if on_progress:
+                    on_progress(len(results))
+        
+        if cell_updates:
+            st.session_state.profiles_version = st.session_state.get('profiles_version', 0) + 1
+            self._flush_cell_updates(config, cell_updates)
+        
+        return results
+    
+    def submit_regeneration_batch(self, profiles: Dict, config: Dict) -> str:
+        """Queue email generation for several profiles as an OpenAI Batch API job.
+        
+        profiles maps dataframe index -> profile data. The job is tracked in
+        st.session_state.pending_batches, along with the sheet it was submitted
+        from, until apply_regeneration_batch sees it finish.
+        """
+        batch_id = self.ai_service.submit_email_batch(
+            profiles, config['openai_api_key'], config['email_max_tokens']
+        )
+        st.session_state.pending_batches.append({
+            'id': batch_id,
+            'count': len(profiles),
+            'submitted': datetime.utcnow().strftime("%Y-%m-%d %H:%M"),
+            'spreadsheet_id': config['spreadsheet_id'],
+            'sheet_name': config['sheet_name'],
+            'draft_col': st.session_state.profiles_df.columns.get_loc("draft")
+        })
+        return batch_id
+    
+    def apply_regeneration_batch(self, batch: Dict, config: Dict) -> Tuple[str, int]:
+        """Check a regeneration batch and write its drafts back once it has completed.
+        
+        batch is a pending_batches entry. Drafts go to the sheet the batch was
+        submitted from; the loaded profiles are only updated if they are still
+        that sheet. Returns (status, number of drafts applied). Batches that
+        completed or ended in failed/expired/cancelled are dropped from pending_batches.
+        """
+        status, results = self.ai_service.get_email_batch(batch['id'], config['openai_api_key'])
+        
+        applied = 0
+        if results:
+            same_sheet = (config['spreadsheet_id'], config['sheet_name']) == (batch['spreadsheet_id'], batch['sheet_name'])
+            df = st.session_state.profiles_df if same_sheet else None
+            cell_updates = []
+            for custom_id, new_email in results.items():
+                idx = int(custom_id)
+                if df is not None:
+                    if idx not in df.index:
+                        continue
+                    df.at[idx, 'draft'] = new_email
+                cell_updates.append((idx + 1, batch['draft_col'], new_email))
+            
+            applied = len(cell_updates)
+            if cell_updates:
+                if df is not None:
+                    st.session_state.profiles_version = st.session_state.get('profiles_version', 0) + 1
+                self._flush_cell_updates(
+                    {**config, 'spreadsheet_id': batch['spreadsheet_id'], 'sheet_name': batch['sheet_name']},
+                    cell_updates
                 )
-
-    def regenerate_email(self, profile_data: Dict, idx: int, config: Dict) -> str:
-        """Regenerate email for a specific profile."""
+        
+        if status in BATCH_FINAL_STATUSES:
+            st.session_state.pending_batches = [
+                pending for pending in st.session_state.pending_batches if pending['id'] != batch['id']
+            ]
+        return status, applied
+    
+    def regenerate_email(self, profile_data: Dict, idx: int, config: Dict, stream_to=None) -> str:
+        """Regenerate email for a specific profile.
+        
+        If stream_to (a Streamlit container) is given, the draft is written into it
+        token by token as it is generated.
+        """
         try:
             # Call the AI service to regenerate the email
-            new_email = self.ai_service.email_call(
-                profile_data,
-                config['openai_api_key'],
-                config['email_max_tokens'],
-                config['timeout_seconds']
-            )
+            if stream_to is not None:
+                new_email = stream_to.write_stream(self.ai_service.email_stream(
+                    profile_data,
+                    config['openai_api_key'],
+                    config['email_max_tokens'],
+                    config['timeout_seconds']
+                ))
+            else:
+                new_email = self.ai_service.email_call(
+                    profile_data,
+                    config['openai_api_key'],
+                    config['email_max_tokens'],
+                    config['timeout_seconds']
+                )
             
             # Update the local dataframe if it exists in session state
             if 'profiles_df' in st.session_state:
                 st.session_state.profiles_df.at[idx, 'draft'] = new_email
+                st.session_state.profiles_version = st.session_state.get('profiles_version', 0) + 1
             
             # Update Google Sheets
-            sheet_id = self.sheets_service.get_sheet_id_by_name(config['spreadsheet_id'], config['sheet_name'])
             draft_col = st.session_state.profiles_df.columns.get_loc("draft")
-            
-            update_request = {
-                "updateCells": {
-                    "range": {
-                        "sheetId": sheet_id,
-                        "startRowIndex": idx + 1,
-                        "endRowIndex": idx + 2,
-                        "startColumnIndex": draft_col,
-                        "endColumnIndex": draft_col + 1,
-                    },
-                    "rows": [{"values": [{"userEnteredValue": {"stringValue": new_email}}]}],
-                    "fields": "userEnteredValue",
-                }
-            }
-            
-            self.sheets_service.batch_update_cells(config['spreadsheet_id'], [update_request])
+            self.sheets_service.batch_update_values(config['spreadsheet_id'], [{
+                "range": a1_range(config['sheet_name'], idx + 1, draft_col),
+                "values": [[new_email]],
+            }])
             
             return new_email
             
@@ -16,7 +16,7 @@ fi
 
 # Check if dependencies are installed
 echo "📦 Checking dependencies..."
-python -c "import streamlit, pandas, litellm, google.oauth2.credentials" 2>/dev/null
+python -c "import sys; from importlib.util import find_spec; sys.exit(not all(find_spec(m) for m in ('streamlit', 'pandas', 'litellm', 'google.oauth2.credentials')))" 2>/dev/null
 if [ $? -eq 0 ]; then
     echo "✅ All required packages are installed"
 else
@@ -4,39 +4,220 @@ Interactive web interface for bulk profile research and personalized email gener
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
+import hashlib
+import html
 import json
+import math
 import os
+import re
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional
 import pandas as pd
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 import litellm
+from streamlit.runtime.caching import get_data_cache_stats_provider
 from prompts import get_default_email_prompt_template, get_email_prompt
 
 # Import our new modules
 from config import ConfigManager
 from cost_tracking import CostTracker, CostEstimator
-from google_services import GoogleSheetsService, GmailService
+from google_services import GoogleSheetsService, GmailService, EMAIL_FIELDS, EMAIL_FIELDS_ORDER
 from ai_service import AIService
-from profile_processor import ProfileProcessor
+from profile_processor import ProfileProcessor, BATCH_FINAL_STATUSES
+
+# Seconds between re-validating stored Google credentials on reruns
+AUTH_CHECK_TTL = 60
+
+# Email drafts shown per page in the Email Preview tab
+EMAIL_PAGE_SIZE = 25
+
+# Sample profile used to check that a custom prompt has all required placeholders
+PROMPT_VALIDATION_PROFILE = {
+    'name': 'Test',
+    'role': 'Test Role',
+    'company': 'Test Company',
+    'research': 'Test research'
+}
+
+# Required columns based on prompts.py
+# Only truly mandatory fields that are always referenced without .get()
+REQUIRED_COLUMNS = (
+    'name',      # Required for both research and email prompts
+    'company',   # Required for both research and email prompts
+    'role',      # Required for both research and email prompts
+    # location, phone, education are optional and handled with .get() in prompts
+    # topic and subtopic are optional and handled with .get() in prompts
+)
+
+# Guidance for processing failures: (pattern, title, heading, tips), checked in order
+PROCESSING_ERROR_ADVICE = (
+    (re.compile(r"rate limit|429", re.I),
+     "❌ **Rate Limit Error:** You've exceeded the API rate limits.",
+     "💡 **Solutions:**",
+     ("• **Reduce Max Workers** - Lower concurrent API requests (try 1-3)",
+      "• **Increase OpenAI Rate Limit** - Check your OpenAI tier in Advanced Settings",
+      "• **Wait and Retry** - API limits reset over time",
+      "• **Upgrade OpenAI Tier** - Higher tiers have higher rate limits")),
+    (re.compile(r"unfinished", re.I),
+     "❌ **Processing Error:** Some tasks did not complete successfully.",
+     "💡 **Common causes:**",
+     ("• **API timeouts** - Try reducing max workers or increasing timeout",
+      "• **API key issues** - Verify your API keys are correct",
+      "• **Network connectivity** - Check your internet connection",
+      "• **Rate limiting** - Reduce concurrent requests (max workers)")),
+    (re.compile(r"timeout", re.I),
+     "❌ **Timeout Error:** API calls took too long to complete.",
+     "💡 **Solutions:**",
+     ("• Increase timeout in Advanced Settings",
+      "• Reduce max workers to make fewer concurrent requests",
+      "• Check your internet connection")),
+    (re.compile(r"api|key", re.I),
+     "❌ **API Error:** Problem with API authentication or quota.",
+     "💡 **Check:**",
+     ("• API keys are correct and valid",
+      "• You have sufficient API credits/quota",
+      "• APIs are not experiencing outages")),
+)
+PROCESSING_ERROR_FALLBACK_TIPS = (
+    "• Check the logs in pipeline.log for more details",
+    "• Reduce the number of profiles or max workers",
+    "• Ensure your spreadsheet data is valid",
+)
+
+# Profile fields used when building a Gmail draft (name, subject fallback, body, recipient)
+DRAFT_PROFILE_FIELDS = frozenset({'name', 'company', 'Company', 'draft'}) | EMAIL_FIELDS
+
+# Display labels for Gmail draft results, applied once when the results table is built
+DRAFT_STATUS_LABELS = {'CREATED': '✅ Created', 'FAILED': '❌ Failed', 'ERROR': '❌ Error'}
+DRAFT_TABLE_COLUMNS = {
+    "profile": "Profile Name",
+    "recipient": "Recipient Email",
+    "subject": "Email Subject",
+    "status": "Status",
+    "draft_id": "Gmail Draft ID"
+}
+
+
+def _credentials_key() -> str:
+    """Fingerprint of the signed-in Google account, used to keep cached sheet data per user."""
+    credentials = st.session_state.get('google_credentials') or {}
+    token = credentials.get('refresh_token') or credentials.get('token') or ""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _resolve_recipients(profiles_df: pd.DataFrame) -> pd.Series:
+    """Each row's recipient: the first non-blank email column in preference order, else ""."""
+    recipients = pd.Series("", index=profiles_df.index)
+    for field in EMAIL_FIELDS_ORDER:
+        if field in profiles_df.columns:
+            values = profiles_df[field].fillna("").astype(str).str.strip()
+            recipients = recipients.mask(recipients == "", values)
+    return recipients
+
+
+class _UncachedResult(Exception):
+    """Raised from a cached fetcher so a result is returned without being cached.
+    
+    Used for results that stand in for a failed lookup.
+    """
+    
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+
+def _uncached_if_empty(value):
+    """Return value, or raise _UncachedResult if it's empty.
+    
+    The Google services report errors by returning an empty result, so empty
+    results must not be cached or a failure would stick until the TTL runs out.
+    """
+    if len(value) == 0:
+        raise _UncachedResult(value)
+    return value
+
+
+def _call_cached(cached_fetcher, *args):
+    """Call a cached fetcher, returning results it declined to cache."""
+    try:
+        return cached_fetcher(*args)
+    except _UncachedResult as e:
+        return e.value
+
+
+@st.cache_data(ttl=300, max_entries=32, show_spinner="Loading profiles from Google Sheets...")
+def _fetch_profiles_cached(spreadsheet_id: str, sheet_name: str, profile_limit: Optional[int],
+                           credentials_key: str, _sheets_service) -> pd.DataFrame:
+    """Fetch profiles through Streamlit's data cache.
+    
+    The service is passed with a leading underscore so Streamlit doesn't hash it;
+    credentials_key keeps one user's sheet data from being served to another.
+    Call through _call_cached.
+    """
+    return _uncached_if_empty(_sheets_service.fetch_profiles(spreadsheet_id, sheet_name, profile_limit))
+
+
+@st.cache_data(ttl=300, max_entries=32, show_spinner="Loading your spreadsheets...")
+def _list_spreadsheets_cached(credentials_key: str, _sheets_service) -> List[Dict]:
+    """List the user's spreadsheets through Streamlit's data cache, per signed-in account.
+    
+    Call through _call_cached.
+    """
+    return _uncached_if_empty(_sheets_service.list_spreadsheets())
+
+
+@st.cache_data(ttl=60, max_entries=32, show_spinner="Loading recent drafts...")
+def _list_recent_drafts_cached(credentials_key: str, _gmail_service) -> List[Dict]:
+    """List the account's recent Gmail drafts, reusing the result for a minute.
+    
+    Call through _call_cached.
+    """
+    return _uncached_if_empty(_gmail_service.list_recent_drafts())
+
+
+@st.cache_data(max_entries=512, ttl=3600, show_spinner=False)
+def _cached_email_prompt(template: str, profile_items: tuple) -> str:
+    """Render an email prompt, reusing the result for identical template and profile."""
+    return get_email_prompt(dict(profile_items), template)
+
+
+@st.cache_data(ttl=600, max_entries=8, show_spinner=False)
+def _estimate_batch_cost(df: pd.DataFrame, research_max_tokens: int, email_max_tokens: int,
+                         _cost_estimator) -> Dict:
+    """Estimate a batch's cost, recomputing only when the rows or token limits change."""
+    return _cost_estimator.estimate_batch_cost(df, {
+        "research_max_tokens": research_max_tokens,
+        "email_max_tokens": email_max_tokens,
+    })
+
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def _sheet_url(spreadsheet_id: str, sheet_name: str, credentials_key: str, _sheets_service) -> str:
+    """Build the Google Sheets URL for a sheet, looking up its gid once per hour.
+    
+    If the lookup fails the URL without a gid is returned uncached. Call through
+    _call_cached.
+    """
+    sheet_id = _sheets_service.get_sheet_id_by_name(spreadsheet_id, sheet_name)
+    if sheet_id is not None:
+        return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit#gid={sheet_id}"
+    raise _UncachedResult(f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit")
 
 
 class StreamlitApp:
     """Main Streamlit application class."""
     
     def __init__(self):
-        self.config = ConfigManager()
-        self.cost_tracker = CostTracker()
-        self.cost_estimator = CostEstimator(self.config)
-        self.sheets_service = GoogleSheetsService(self.config)
-        self.gmail_service = GmailService(self.config)
-        self.ai_service = AIService(self.config)
-        self.processor = ProfileProcessor(self.sheets_service, self.ai_service, self.cost_tracker)
+        # Services are built once per session rather than on every rerun. They hold the
+        # signed-in user's Google credentials and cost totals, so they aren't shared
+        # across sessions with st.cache_resource.
+        if 'services' not in st.session_state:
+            st.session_state.services = self._build_services()
+        (self.config, self.cost_tracker, self.cost_estimator, self.sheets_service,
+         self.gmail_service, self.ai_service, self.processor) = st.session_state.services
         
         # Set up litellm callback
         litellm.success_callback = [self.cost_tracker.track_cost]
@@ -51,30 +232,41 @@ class StreamlitApp:
             initial_sidebar_state="collapsed"
         )
     
+    @staticmethod
+    def _build_services() -> tuple:
+        """Create the config, trackers and API services used by the app."""
+        config = ConfigManager()
+        cost_tracker = CostTracker()
+        sheets_service = GoogleSheetsService(config)
+        ai_service = AIService(config)
+        return (
+            config,
+            cost_tracker,
+            CostEstimator(config),
+            sheets_service,
+            GmailService(config),
+            ai_service,
+            ProfileProcessor(sheets_service, ai_service, cost_tracker),
+        )
+    
     def _init_session_state(self):
         """Initialize Streamlit session state variables."""
         if 'processing' not in st.session_state:
             st.session_state.processing = False
+        if 'stop_event' not in st.session_state:
+            st.session_state.stop_event = threading.Event()  # Set to stop a processing run
         if 'results' not in st.session_state:
             st.session_state.results = []
-        if 'cost_tracking' not in st.session_state:
-            st.session_state.cost_tracking = self.cost_tracker.cost_data
-        if 'total_cost' not in st.session_state:
-            st.session_state.total_cost = self.cost_tracker.total_cost
         if 'google_credentials' not in st.session_state:
             st.session_state.google_credentials = None
         if 'authenticated' not in st.session_state:
             st.session_state.authenticated = False
-        if 'spreadsheets' not in st.session_state:
-            st.session_state.spreadsheets = None
         if 'selected_spreadsheet' not in st.session_state:
             st.session_state.selected_spreadsheet = None
         if 'selected_sheet' not in st.session_state:
             st.session_state.selected_sheet = None
         if 'current_sheet_key' not in st.session_state:
             st.session_state.current_sheet_key = None
-        if 'newly_processed' not in st.session_state:
-            st.session_state.newly_processed = set()  # Track newly processed items
         if 'session_results' not in st.session_state:
             st.session_state.session_results = []  # Track results from current session
         if 'gmail_authenticated' not in st.session_state:
@@ -83,20 +275,39 @@ class StreamlitApp:
             st.session_state.processing_complete = False
         if 'gmail_drafts_created' not in st.session_state:
             st.session_state.gmail_drafts_created = []
+        if 'gmail_drafts_df' not in st.session_state:
+            st.session_state.gmail_drafts_df = None
+        if 'pending_batches' not in st.session_state:
+            st.session_state.pending_batches = []  # OpenAI batch jobs for bulk regeneration
+        if 'profiles_version' not in st.session_state:
+            st.session_state.profiles_version = 0  # Bumped whenever profiles_df changes
         if 'custom_email_prompt' not in st.session_state:
             st.session_state.custom_email_prompt = None
         if 'use_custom_prompt' not in st.session_state:
             st.session_state.use_custom_prompt = False
         if 'oauth_started' not in st.session_state:
             st.session_state.oauth_started = False
+        if 'auth_last_checked' not in st.session_state:
+            st.session_state.auth_last_checked = 0.0
+        if 'custom_prompt_hash' not in st.session_state:
+            st.session_state.custom_prompt_hash = None
+        if 'custom_prompt_error' not in st.session_state:
+            st.session_state.custom_prompt_error = None
     
     def render_authentication_section(self):
         """Render authentication section."""
         st.subheader("🔐 Google Authentication")
         
         if st.session_state.authenticated:
-            sheets_status = self.sheets_service.authenticate_user()
-            gmail_status = self.gmail_service.authenticate_user()
+            # Re-validate the stored token at most once per AUTH_CHECK_TTL; services
+            # still authenticate lazily through get_service() when they are used
+            if time.monotonic() - st.session_state.auth_last_checked > AUTH_CHECK_TTL:
+                sheets_status = self.sheets_service.authenticate_user()
+                gmail_status = self.gmail_service.authenticate_user()
+                if sheets_status and gmail_status:
+                    st.session_state.auth_last_checked = time.monotonic()
+            else:
+                sheets_status = gmail_status = True
             
             # Both services must be authenticated
             if not sheets_status or not gmail_status:
@@ -125,12 +336,14 @@ class StreamlitApp:
                 if st.button("🔄 Refresh Authentication"):
                     st.session_state.authenticated = False
                     st.session_state.gmail_authenticated = False
-                    st.session_state.spreadsheets = None
                     st.session_state.selected_spreadsheet = None
                     st.session_state.selected_sheet = None
                     st.session_state.oauth_started = False
+                    st.session_state.auth_last_checked = 0.0
                     if 'google_credentials' in st.session_state:
                         del st.session_state.google_credentials
+                    self.sheets_service.reset()
+                    self.gmail_service.reset()
                     st.rerun()
             return True
         else:
@@ -189,7 +402,10 @@ class StreamlitApp:
         
         with st.spinner("Calculating cost estimate..."):
             try:
-                cost_estimate = self.cost_estimator.estimate_batch_cost(df, config)
+                # Only the token limits affect the estimate, so other sidebar changes hit the cache
+                cost_estimate = _estimate_batch_cost(
+                    df, config['research_max_tokens'], config['email_max_tokens'], self.cost_estimator
+                )
                 
                 # Summary metrics
                 col1, col2 = st.columns(2)
@@ -233,18 +449,14 @@ class StreamlitApp:
                     # Show per-profile breakdown
                     if len(cost_estimate['breakdown']) > 0:
                         st.subheader("Per-Profile Cost Breakdown")
-                        breakdown_df = pd.DataFrame(cost_estimate['breakdown'])
-                        # Format cost columns as currency
-                        for col in ['research_cost', 'email_cost', 'total_cost']:
-                            breakdown_df[col] = breakdown_df[col].apply(lambda x: f"${x:.4f}")
-                        
+                        # Costs stay numeric (and sortable); the frontend formats them as currency
                         st.dataframe(
-                            breakdown_df,
+                            cost_estimate['breakdown'],
                             column_config={
                                 "profile": "Profile Name",
-                                "research_cost": "Research Cost",
-                                "email_cost": "Email Cost", 
-                                "total_cost": "Total Cost"
+                                "research_cost": st.column_config.NumberColumn("Research Cost", format="$%.4f"),
+                                "email_cost": st.column_config.NumberColumn("Email Cost", format="$%.4f"),
+                                "total_cost": st.column_config.NumberColumn("Total Cost", format="$%.4f")
                             },
                             use_container_width=True
                         )
@@ -275,23 +487,24 @@ class StreamlitApp:
         
         # Get list of spreadsheets
         if st.button("🔄 Refresh Spreadsheets"):
-            st.session_state.spreadsheets = None
+            _list_spreadsheets_cached.clear()
             st.session_state.selected_spreadsheet = None
             st.session_state.selected_sheet = None
             st.session_state.current_sheet_key = None
+            for key in [key for key in st.session_state if key.startswith("meta_")]:
+                del st.session_state[key]
+            _fetch_profiles_cached.clear()
             st.rerun()
         
-        # Load spreadsheets if not already loaded or if explicitly refreshed
-        if 'spreadsheets' not in st.session_state or st.session_state.spreadsheets is None:
-            with st.spinner("Loading your spreadsheets..."):
-                st.session_state.spreadsheets = self.sheets_service.list_spreadsheets()
+        # Cached for a few minutes per account; Refresh Spreadsheets clears it
+        spreadsheets = _call_cached(_list_spreadsheets_cached, _credentials_key(), self.sheets_service)
         
-        if not st.session_state.spreadsheets:
+        if not spreadsheets:
             st.error("No spreadsheets found or error loading spreadsheets")
             return None
         
         # Spreadsheet selection
-        spreadsheet_options = {f"{ss['name']} (Modified: {ss['modified'][:10]})": ss for ss in st.session_state.spreadsheets}
+        spreadsheet_options = {f"{ss['name']} (Modified: {ss['modified'][:10]})": ss for ss in spreadsheets}
         selected_spreadsheet_display = st.selectbox(
             "Choose a spreadsheet:",
             options=list(spreadsheet_options.keys()),
@@ -350,6 +563,17 @@ class StreamlitApp:
             max_workers = st.slider("Max Workers", 1, 10, 3)
             research_max_tokens = st.slider("Research Max Tokens", 100, 2000, 800)
             email_max_tokens = st.slider("Email Max Tokens", 100, 1000, 350)
+            email_rows_per_call = st.slider(
+                "Emails per LLM call", 1, 16, 1,
+                help="Draft several profiles that already have research in one OpenAI request. "
+                     "Fewer requests against the RPM limit, but each draft gets less of the model's attention."
+            )
+            use_batch_api = st.checkbox(
+                "Use Batch API for new emails (50% off, up to 24h)",
+                value=False,
+                help="Processing runs research as usual, then submits all missing email drafts as one OpenAI "
+                     "Batch API job. Apply the results from the Email Management tab once it finishes."
+            )
             timeout_seconds = st.slider("Timeout (seconds)", 10, 120, 40)
             profile_limit = st.number_input("Profile Limit (0 = all)", 0, 1000, 0)
             
@@ -364,6 +588,20 @@ class StreamlitApp:
             
             # Add rate limiting information
             st.info("💡 **Rate Limiting:** Max workers reduced to prevent API rate limits. Higher values may cause rate limit errors.")
+            
+            # On-disk cache of research and drafts for the main processing run
+            st.write("**🗃️ LLM Cache**")
+            use_llm_cache = st.checkbox(
+                "Use LLM cache",
+                value=False,
+                help="Reuse stored research and drafts for identical requests instead of paying for them again. "
+                     "Regenerating an email always makes a fresh call."
+            )
+            if st.button("Clear LLM cache", help="Remove all cached completions"):
+                removed = self.ai_service.llm_cache.clear()
+                st.success(f"LLM cache cleared! Removed {removed} cached completions.")
+            
+            st.checkbox("Show cache stats", key="debug_mode", help="Show the memory used by cached sheet data and prompts")
         
         # Custom Email Prompt section
         with st.sidebar.expander("✉️ Custom Email Prompt", expanded=False):
@@ -420,19 +658,21 @@ class StreamlitApp:
                 for placeholder in placeholders:
                     st.write(f"• `{placeholder}`")
                 
-                # Validation
-                try:
-                    # Test if the prompt has all required placeholders
-                    test_profile = {
-                        'name': 'Test',
-                        'role': 'Test Role',
-                        'company': 'Test Company',
-                        'research': 'Test research'
-                    }
-                    get_email_prompt(test_profile, custom_prompt)
+                # Validation - only re-run when the prompt text changes
+                prompt_hash = hash(custom_prompt)
+                if st.session_state.custom_prompt_hash != prompt_hash:
+                    try:
+                        # Test if the prompt has all required placeholders
+                        get_email_prompt(PROMPT_VALIDATION_PROFILE, custom_prompt)
+                        st.session_state.custom_prompt_error = None
+                    except Exception as e:
+                        st.session_state.custom_prompt_error = str(e)
+                    st.session_state.custom_prompt_hash = prompt_hash
+                
+                if st.session_state.custom_prompt_error is None:
                     st.success("✅ Custom prompt is valid!")
-                except Exception as e:
-                    st.error(f"❌ Prompt validation error: {str(e)}")
+                else:
+                    st.error(f"❌ Prompt validation error: {st.session_state.custom_prompt_error}")
                     st.info("💡 Make sure all required placeholders are included")
             else:
                 st.info("Using default email prompt. Enable custom prompt above to customize.")
@@ -446,33 +686,33 @@ class StreamlitApp:
         
         # Cost tracking section - integrated into configuration
         with st.sidebar.expander("💰 Cost Tracking", expanded=True):
-            # Sync with cost tracker
-            st.session_state.cost_tracking = self.cost_tracker.cost_data
-            st.session_state.total_cost = self.cost_tracker.total_cost
-            
-            # Cost metrics
+            # Cost metrics - read straight from the tracker, which is the source of truth
             col_a, col_b = st.columns(2)
             with col_a:
-                st.metric("Total Cost", f"${st.session_state.total_cost:.3f}")
+                st.metric("Total Cost", f"${self.cost_tracker.total_cost:.3f}")
             with col_b:
-                total_calls = (st.session_state.cost_tracking['perplexity']['calls'] + 
-                              st.session_state.cost_tracking['openai']['calls'])
-                st.metric("Total Calls", total_calls)
+                st.metric("Total Calls", self.cost_tracker.total_calls())
             
             # Provider breakdown
             st.write("**Provider Details:**")
-            for provider, data in st.session_state.cost_tracking.items():
+            for provider, data in self.cost_tracker.cost_data.items():
                 st.write(f"**{provider.title()}:** {data['calls']} calls, {data['tokens']:,} tokens, ${data['cost']:.3f}")
         
+        if st.session_state.get('debug_mode'):
+            self.render_cache_stats()
+        
         config = {
             'perplexity_api_key': perplexity_api_key,
             'openai_api_key': openai_api_key,
             'max_workers': max_workers,
             'research_max_tokens': research_max_tokens,
             'email_max_tokens': email_max_tokens,
+            'email_rows_per_call': email_rows_per_call,
+            'use_batch_api': use_batch_api,
             'timeout_seconds': timeout_seconds,
             'profile_limit': profile_limit if profile_limit > 0 else None,
-            'openai_rpm_limit': openai_rpm_limit  # Add rate limit configuration
+            'openai_rpm_limit': openai_rpm_limit,  # Add rate limit configuration
+            'use_llm_cache': use_llm_cache
         }
         
         # Add sheet selection to config if available
@@ -484,6 +724,28 @@ class StreamlitApp:
         
         return config
     
+    def render_cache_stats(self):
+        """Show memory used by each st.cache_data function, with a button to evict them all."""
+        with st.sidebar.expander("🗄️ Cache Stats", expanded=True):
+            stats = get_data_cache_stats_provider().get_stats()
+            # Newer Streamlit versions group the stats by metric family
+            if isinstance(stats, dict):
+                stats = [stat for family in stats.values() for stat in family]
+            
+            if stats:
+                stats_df = (
+                    pd.DataFrame([{'cache': stat.cache_name.rsplit('.', 1)[-1], 'bytes': stat.byte_length} for stat in stats])
+                    .groupby('cache')['bytes']
+                    .agg(entries='size', size_kb=lambda b: round(b.sum() / 1024, 1))
+                )
+                st.dataframe(stats_df, use_container_width=True)
+            else:
+                st.write("No cached entries")
+            
+            if st.button("🧹 Evict caches", help="Clear every st.cache_data entry for all sessions"):
+                st.cache_data.clear()
+                st.rerun()
+    
     def render_profile_section(self, config: Dict):
         """Render profile data section."""
         st.subheader("📋 Profile Data")
@@ -494,11 +756,9 @@ class StreamlitApp:
             return
         
         # Add button to open spreadsheet in Google Sheets
-        sheet_id = self.sheets_service.get_sheet_id_by_name(config['spreadsheet_id'], config['sheet_name'])
-        if sheet_id is not None:
-            spreadsheet_url = f"https://docs.google.com/spreadsheets/d/{config['spreadsheet_id']}/edit#gid={sheet_id}"
-        else:
-            spreadsheet_url = f"https://docs.google.com/spreadsheets/d/{config['spreadsheet_id']}/edit"
+        spreadsheet_url = _call_cached(
+            _sheet_url, config['spreadsheet_id'], config['sheet_name'], _credentials_key(), self.sheets_service
+        )
         
         col1, col2 = st.columns([1, 3])
         with col1:
@@ -519,14 +779,17 @@ class StreamlitApp:
             'profiles_df' not in st.session_state):
             
             try:
-                with st.spinner("Loading profiles from Google Sheets..."):
-                    df = self.sheets_service.fetch_profiles(
-                        config['spreadsheet_id'], 
-                        config['sheet_name'], 
-                        config['profile_limit']
-                    )
-                    st.session_state.profiles_df = df
-                    st.session_state.current_sheet_key = current_sheet_key
+                df = _call_cached(
+                    _fetch_profiles_cached,
+                    config['spreadsheet_id'], 
+                    config['sheet_name'], 
+                    config['profile_limit'],
+                    _credentials_key(),
+                    self.sheets_service
+                )
+                st.session_state.profiles_df = df
+                st.session_state.profiles_version += 1
+                st.session_state.current_sheet_key = current_sheet_key
             except Exception as e:
                 st.error(f"Error loading profiles: {str(e)}")
                 self.config.logger.error(f"Error loading profiles: {e}")
@@ -549,8 +812,7 @@ class StreamlitApp:
             else:
                 st.success("✅ All required columns found!")
                 # Check for email column for Gmail functionality
-                email_fields = ['email', 'Email', 'email_address', 'Email_Address', 'contact_email', 'work_email']
-                has_email_column = any(field in df.columns for field in email_fields)
+                has_email_column = not df.columns.intersection(EMAIL_FIELDS).empty
                 if has_email_column:
                     st.success("✅ Email column detected - Gmail drafts will include recipients!")
                 else:
@@ -573,21 +835,42 @@ class StreamlitApp:
                 
                 if st.button("🚀 Start Processing", type="primary", disabled=st.session_state.processing, use_container_width=True):
                     # Clear previous session results
-                    st.session_state.newly_processed = set()
                     st.session_state.session_results = []
                     st.session_state.processing = True
+                    st.session_state.stop_event = threading.Event()
                     st.rerun()
         else:
             st.info("No profiles found in the selected sheet")
     
+    def _stop_processing(self):
+        """Stop button callback, run at the start of the rerun its click triggers."""
+        st.session_state.stop_event.set()
+        st.session_state.processing = False
+        # Results that finished before the stop were written to the sheet; reload
+        # it so they show up
+        _fetch_profiles_cached.clear()
+        st.session_state.current_sheet_key = None
+        st.warning("Processing stopped by user")
+    
     def render_processing_section(self, config: Dict):
         """Render processing section."""
+        if st.session_state.processing and st.session_state.stop_event.is_set():
+            # Some other click interrupted the last run, which set stop_event on its
+            # way out - stop rather than start over, and reload what it saved
+            self._stop_processing()
+            st.rerun()
+        
         if st.session_state.processing and 'profiles_df' in st.session_state:
             st.subheader("⚡ Processing")
             
+            # Drawn before processing starts so it can be clicked mid-run: the click
+            # reruns the app, which interrupts process_profiles at its next UI update
+            st.button("⏹️ Stop Processing", on_click=self._stop_processing)
+            
             progress_bar = st.progress(0)
             status_text = st.empty()
-            results_container = st.container()
+            st.subheader("✨ New Results This Session")
+            results_container = st.empty()
             
             try:
                 # Update rate limiting configuration before processing
@@ -596,21 +879,31 @@ class StreamlitApp:
                 
                 start_time = time.time()
                 processed_df = self.processor.process_profiles(
-                    st.session_state.profiles_df.copy(), 
+                    st.session_state.profiles_df, 
                     config, 
                     progress_bar, 
                     status_text,
-                    results_container
+                    results_container,
+                    stop_event=st.session_state.stop_event
                 )
                 
                 elapsed = time.time() - start_time
                 st.session_state.processing = False
+                st.session_state.profiles_df = processed_df
+                st.session_state.profiles_version = st.session_state.get('profiles_version', 0) + 1
                 
-                # Save summary
-                self.cost_tracker.save_summary({
-                    "elapsed_sec": elapsed,
-                    "profiles_processed": len(processed_df),
-                })
+                # The sheet now has new research/drafts, so cached fetches are stale
+                _fetch_profiles_cached.clear()
+                
+                # Save summary in the background so the completion message isn't held up by disk I/O
+                threading.Thread(
+                    target=self.cost_tracker.save_summary,
+                    args=({
+                        "elapsed_sec": elapsed,
+                        "profiles_processed": len(processed_df),
+                    },),
+                    daemon=True
+                ).start()
                 
                 # Mark processing as complete for Gmail integration
                 st.session_state.processing_complete = True
@@ -622,39 +915,17 @@ class StreamlitApp:
                 st.session_state.processing = False
                 error_msg = str(e)
                 
-                # Provide more specific error guidance
-                if "rate limit" in error_msg.lower() or "429" in error_msg:
-                    st.error("❌ **Rate Limit Error:** You've exceeded the API rate limits.")
-                    st.info("💡 **Solutions:**")
-                    st.info("• **Reduce Max Workers** - Lower concurrent API requests (try 1-3)")
-                    st.info("• **Increase OpenAI Rate Limit** - Check your OpenAI tier in Advanced Settings")
-                    st.info("• **Wait and Retry** - API limits reset over time")
-                    st.info("• **Upgrade OpenAI Tier** - Higher tiers have higher rate limits")
-                elif "unfinished" in error_msg.lower():
-                    st.error("❌ **Processing Error:** Some tasks did not complete successfully.")
-                    st.info("💡 **Common causes:**")
-                    st.info("• **API timeouts** - Try reducing max workers or increasing timeout")
-                    st.info("• **API key issues** - Verify your API keys are correct")
-                    st.info("• **Network connectivity** - Check your internet connection")
-                    st.info("• **Rate limiting** - Reduce concurrent requests (max workers)")
-                elif "timeout" in error_msg.lower():
-                    st.error("❌ **Timeout Error:** API calls took too long to complete.")
-                    st.info("💡 **Solutions:**")
-                    st.info("• Increase timeout in Advanced Settings")
-                    st.info("• Reduce max workers to make fewer concurrent requests")
-                    st.info("• Check your internet connection")
-                elif "api" in error_msg.lower() or "key" in error_msg.lower():
-                    st.error("❌ **API Error:** Problem with API authentication or quota.")
-                    st.info("💡 **Check:**")
-                    st.info("• API keys are correct and valid")
-                    st.info("• You have sufficient API credits/quota")
-                    st.info("• APIs are not experiencing outages")
+                # Provide more specific error guidance - first matching pattern wins
+                for pattern, title, heading, tips in PROCESSING_ERROR_ADVICE:
+                    if pattern.search(error_msg):
+                        st.error(title)
+                        break
                 else:
                     st.error(f"❌ **Processing failed:** {error_msg}")
-                    st.info("💡 **Try:**")
-                    st.info("• Check the logs in pipeline.log for more details")
-                    st.info("• Reduce the number of profiles or max workers")
-                    st.info("• Ensure your spreadsheet data is valid")
+                    heading, tips = "💡 **Try:**", PROCESSING_ERROR_FALLBACK_TIPS
+                st.info(heading)
+                for tip in tips:
+                    st.info(tip)
                 
                 # Show additional troubleshooting info
                 with st.expander("🔧 Troubleshooting Details", expanded=False):
@@ -672,13 +943,6 @@ class StreamlitApp:
                     st.json(config_summary)
                 
                 self.config.logger.error(f"Processing failed: {e}")
-        
-        # Stop button
-        if st.session_state.processing:
-            if st.button("⏹️ Stop Processing"):
-                st.session_state.processing = False
-                st.warning("Processing stopped by user")
-                st.rerun()
     
     def render_gmail_drafts_section(self):
         """Render Gmail drafts creation section."""
@@ -695,23 +959,16 @@ class StreamlitApp:
             return
         
         df = st.session_state.profiles_df
-        completed_profiles = df[df['draft'].notna() & (df['draft'] != '')].copy()
+        completed_profiles = self._completed_profiles()
         
         if completed_profiles.empty:
             st.warning("⚠️ No completed email drafts found to create Gmail drafts")
             st.info("💡 Complete the research and email generation process first, then return to this tab to create Gmail drafts.")
             return
         
-        # Check for email addresses in the data
-        email_fields = ['email', 'Email', 'email_address', 'Email_Address', 'contact_email', 'work_email']
-        has_email_column = any(field in df.columns for field in email_fields)
-        profiles_with_email = 0
-        
-        if has_email_column:
-            for field in email_fields:
-                if field in completed_profiles.columns:
-                    profiles_with_email += completed_profiles[field].notna().sum()
-                    break
+        # Check for email addresses in the data, counting rows the same way drafts pick recipients
+        has_email_column = not df.columns.intersection(EMAIL_FIELDS).empty
+        profiles_with_email = int(_resolve_recipients(completed_profiles).ne("").sum())
         
         # Show processing status
         if st.session_state.processing_complete:
@@ -732,7 +989,7 @@ class StreamlitApp:
         with st.expander("📋 About Email Recipients", expanded=not has_email_column):
             st.write("**To include recipients in Gmail drafts:**")
             st.write("• Add an email column to your spreadsheet with one of these names:")
-            st.code(", ".join(email_fields))
+            st.code(", ".join(EMAIL_FIELDS_ORDER))
             st.write("• The app will automatically detect and use email addresses")
             st.write("• Drafts without email addresses will still be created (you can add recipients manually in Gmail)")
             st.write("• **Tip:** The most common column name is simply `email`")
@@ -755,107 +1012,109 @@ class StreamlitApp:
                 self._show_recent_drafts()
         
         # Show created drafts from this session
-        if st.session_state.gmail_drafts_created:
+        if st.session_state.gmail_drafts_df is not None:
             st.subheader("✅ Drafts Created This Session")
-            drafts_df = pd.DataFrame(st.session_state.gmail_drafts_created)
-            st.dataframe(
-                drafts_df,
-                column_config={
-                    "profile": "Profile Name",
-                    "recipient": "Recipient Email",
-                    "subject": "Email Subject",
-                    "status": "Status",
-                    "draft_id": "Gmail Draft ID"
-                },
-                use_container_width=True,
-                hide_index=True
-            )
+            st.dataframe(st.session_state.gmail_drafts_df, use_container_width=True, hide_index=True)
             
             # Add link to Gmail
             st.markdown("🔗 [Open Gmail Drafts](https://mail.google.com/mail/u/0/#drafts)")
     
+    def _completed_profiles(self) -> pd.DataFrame:
+        """Rows of profiles_df that have an email draft.
+        
+        The filtered frame is kept in session state and only recomputed when
+        profiles_version changes. Callers only read it, so it is not copied.
+        """
+        version = st.session_state.profiles_version
+        if st.session_state.get('completed_profiles_version') != version:
+            df = st.session_state.profiles_df
+            drafts = df['draft']
+            st.session_state.completed_profiles = df.loc[drafts.notna() & drafts.ne('')]
+            st.session_state.completed_profiles_version = version
+        return st.session_state.completed_profiles
+    
     def _create_gmail_drafts(self, profiles_df: pd.DataFrame, subject_prefix: str = ""):
         """Create Gmail drafts for completed profiles."""
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        total_profiles = len(profiles_df)
         successful_drafts = 0
         failed_drafts = 0
         
         # Clear previous session drafts
         st.session_state.gmail_drafts_created = []
+        st.session_state.gmail_drafts_df = None
         
-        for idx, (_, row) in enumerate(profiles_df.iterrows()):
-            profile = row.to_dict()
+        # Resolve each row's recipient up front in one pass per email column
+        recipients = _resolve_recipients(profiles_df)
+        
+        # Only the fields the draft builder reads are carried into each profile dict
+        columns = [col for col in profiles_df.columns if col in DRAFT_PROFILE_FIELDS]
+        pending = []
+        for idx, values in enumerate(profiles_df[columns].itertuples(index=False, name=None)):
+            profile = dict(zip(columns, values))
             email_content = profile.get('draft', '')
             
             if not email_content:
                 continue
             
-            # Extract recipient email using same logic as create_draft
-            recipient_email = None
-            email_fields = ['email', 'Email', 'email_address', 'Email_Address', 'contact_email', 'work_email']
-            for field in email_fields:
-                if field in profile and profile[field] and str(profile[field]).strip():
-                    recipient_email = str(profile[field]).strip()
-                    break
-            
-            status_text.text(f"Creating draft for {profile.get('name', 'Unknown')}...")
-            
-            try:
-                draft_id = self.gmail_service.create_draft(
-                    profile, 
-                    email_content, 
-                    subject_prefix
-                )
-                
-                if draft_id:
-                    successful_drafts += 1
-                    # Extract subject for display
-                    lines = email_content.split('\n')
-                    subject = next((line[8:].strip() for line in lines if line.lower().startswith('subject:')), 
-                                 f"Partnership Opportunity - {profile.get('company', 'Your Company')}")
-                    
-                    if subject_prefix:
-                        subject = f"{subject_prefix}{subject}"
-                    
-                    st.session_state.gmail_drafts_created.append({
-                        "profile": profile.get('name', 'Unknown'),
-                        "recipient": recipient_email or 'No email found',
-                        "subject": subject,
-                        "status": "✅ Created",
-                        "draft_id": draft_id
-                    })
-                else:
-                    failed_drafts += 1
-                    st.session_state.gmail_drafts_created.append({
-                        "profile": profile.get('name', 'Unknown'),
-                        "recipient": recipient_email or 'No email found',
-                        "subject": "Failed to create",
-                        "status": "❌ Failed",
-                        "draft_id": "N/A"
-                    })
-                    
-            except Exception as e:
+            pending.append((profile, email_content, recipients.iat[idx] or None))
+        
+        def update_progress(done: int):
+            progress_bar.progress(done / len(pending))
+            status_text.text(f"Created {done} of {len(pending)} drafts...")
+        
+        # Drafts are sent to Gmail in batched HTTP requests rather than one call each
+        status_text.text(f"Creating {len(pending)} drafts...")
+        results = self.gmail_service.create_drafts_batch(
+            [(profile, email_content) for profile, email_content, _ in pending],
+            subject_prefix,
+            on_progress=update_progress
+        )
+        
+        # Each result carries the subject the draft was built with, so drafts are only parsed once
+        for (profile, email_content, recipient_email), (result, subject) in zip(pending, results):
+            if isinstance(result, Exception):
                 failed_drafts += 1
                 st.session_state.gmail_drafts_created.append({
                     "profile": profile.get('name', 'Unknown'),
                     "recipient": recipient_email or 'No email found',
-                    "subject": f"Error: {str(e)[:50]}...",
-                    "status": "❌ Error",
+                    "subject": f"Error: {str(result)[:50]}...",
+                    "status": "ERROR",
+                    "draft_id": "N/A"
+                })
+                self.config.logger.error(f"Error creating draft for {profile.get('name')}: {result}")
+            elif result:
+                successful_drafts += 1
+                st.session_state.gmail_drafts_created.append({
+                    "profile": profile.get('name', 'Unknown'),
+                    "recipient": recipient_email or 'No email found',
+                    "subject": subject,
+                    "status": "CREATED",
+                    "draft_id": result
+                })
+            else:
+                failed_drafts += 1
+                st.session_state.gmail_drafts_created.append({
+                    "profile": profile.get('name', 'Unknown'),
+                    "recipient": recipient_email or 'No email found',
+                    "subject": "Failed to create",
+                    "status": "FAILED",
                     "draft_id": "N/A"
                 })
-                self.config.logger.error(f"Error creating draft for {profile.get('name')}: {e}")
-            
-            # Update progress
-            progress = (idx + 1) / total_profiles
-            progress_bar.progress(progress)
+        
+        # Build the results table once here rather than on every rerun of the tab
+        if st.session_state.gmail_drafts_created:
+            drafts_df = pd.DataFrame(st.session_state.gmail_drafts_created)
+            drafts_df['status'] = drafts_df['status'].map(DRAFT_STATUS_LABELS).astype('category')
+            st.session_state.gmail_drafts_df = drafts_df.rename(columns=DRAFT_TABLE_COLUMNS)
         
         # Final status
         status_text.text(f"Completed! {successful_drafts} successful, {failed_drafts} failed")
         
         if successful_drafts > 0:
+            # The new drafts should show up under View Recent Drafts straight away
+            _list_recent_drafts_cached.clear()
             st.success(f"✅ Successfully created {successful_drafts} Gmail drafts!")
             st.balloons()
         
@@ -864,8 +1123,7 @@ class StreamlitApp:
     
     def _show_recent_drafts(self):
         """Show recent Gmail drafts."""
-        with st.spinner("Loading recent drafts..."):
-            recent_drafts = self.gmail_service.list_recent_drafts()
+        recent_drafts = _call_cached(_list_recent_drafts_cached, _credentials_key(), self.gmail_service)
         
         if recent_drafts:
             st.subheader("📋 Recent Gmail Drafts")
@@ -896,12 +1154,14 @@ class StreamlitApp:
             # Clear session state
             st.session_state.authenticated = False
             st.session_state.gmail_authenticated = False
-            st.session_state.spreadsheets = None
             st.session_state.selected_spreadsheet = None
             st.session_state.selected_sheet = None
             st.session_state.oauth_started = False
+            st.session_state.auth_last_checked = 0.0
             if 'google_credentials' in st.session_state:
                 del st.session_state.google_credentials
+            self.sheets_service.reset()
+            self.gmail_service.reset()
             
             # Delete token file if it exists
             token_path = "token.json"
@@ -996,33 +1256,48 @@ class StreamlitApp:
         Returns:
             tuple: (is_valid, missing_columns)
         """
-        # Required columns based on prompts.py
-        # Only truly mandatory fields that are always referenced without .get()
-        required_columns = [
-            'name',      # Required for both research and email prompts
-            'company',   # Required for both research and email prompts  
-            'role',      # Required for both research and email prompts
-            # location, phone, education are now optional and handled with .get() in prompts
-            # topic and subtopic are optional and handled with .get() in prompts
-        ]
-        
-        # Convert dataframe columns to lowercase for case-insensitive comparison
-        df_columns_lower = [col.lower() for col in df.columns]
-        
-        missing_columns = []
-        for col in required_columns:
-            if col.lower() not in df_columns_lower:
-                missing_columns.append(col)
-        
-        return len(missing_columns) == 0, missing_columns
+        # Set of lowercased column names for case-insensitive comparison
+        df_columns_lower = {col.lower() for col in df.columns}
+        
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in df_columns_lower]
+        return not missing_columns, missing_columns
 
+    def _render_pending_batches(self, config: Dict):
+        """List Batch API jobs submitted this session, with a button to apply finished ones."""
+        if not st.session_state.pending_batches:
+            return
+        
+        st.write("**⏳ Pending Batch Jobs**")
+        for batch in st.session_state.pending_batches:
+            st.write(f"• `{batch['id']}` - {batch['count']} emails for sheet '{batch['sheet_name']}', "
+                     f"submitted {batch['submitted']} UTC")
+        
+        if st.button("🔍 Check Batch Status", help="Apply the drafts from any batch jobs that have finished"):
+            for batch in list(st.session_state.pending_batches):
+                try:
+                    status, applied = self.processor.apply_regeneration_batch(batch, config)
+                except Exception as e:
+                    st.error(f"❌ Could not check batch {batch['id']}: {str(e)}")
+                    continue
+                
+                if status == "completed":
+                    _fetch_profiles_cached.clear()
+                    st.success(f"✅ Batch {batch['id']} complete - {applied} emails updated")
+                elif status in BATCH_FINAL_STATUSES:
+                    st.error(f"❌ Batch {batch['id']} {status}")
+                else:
+                    st.info(f"⏳ Batch {batch['id']} is {status.replace('_', ' ')}")
+        st.markdown("---")
+    
     def render_email_management_section(self, config: Dict):
         """Render email management section for viewing and regenerating emails."""
         st.subheader("📧 Email Management")
         
         # Custom Prompt Testing Section
         if st.session_state.use_custom_prompt and st.session_state.custom_email_prompt:
-            with st.expander("🧪 Test Custom Email Prompt", expanded=False):
+            # A collapsed expander still runs and sends its widgets, so the sample-data
+            # inputs are only rendered while this toggle is on
+            if st.toggle("🧪 Test Custom Email Prompt", key="show_prompt_test"):
                 st.write("**Test your custom prompt with sample data**")
                 
                 # Sample profile data for testing
@@ -1062,7 +1337,9 @@ class StreamlitApp:
                         }
                         
                         # Generate prompt using custom template
-                        generated_prompt = get_email_prompt(test_profile, st.session_state.custom_email_prompt)
+                        generated_prompt = _cached_email_prompt(
+                            st.session_state.custom_email_prompt, tuple(sorted(test_profile.items()))
+                        )
                         
                         st.success("✅ Custom prompt generated successfully!")
                         st.subheader("📝 Generated Prompt Preview:")
@@ -1100,8 +1377,11 @@ class StreamlitApp:
         else:
             st.info("📝 **Using Default Email Prompt** - Enable custom prompt in the sidebar to customize")
         
+        # Batch jobs from processing or bulk regeneration - shown even before any drafts exist
+        self._render_pending_batches(config)
+        
         # Filter profiles that have emails
-        profiles_with_emails = df[df['draft'].notna() & (df['draft'] != '')].copy()
+        profiles_with_emails = self._completed_profiles()
         
         if profiles_with_emails.empty:
             st.info("💡 No email drafts found. Complete the research and email generation process first.")
@@ -1113,14 +1393,28 @@ class StreamlitApp:
         tab1, tab2 = st.tabs(["📧 Email Preview", "🔄 Bulk Actions"])
         
         with tab1:
-            # Email preview and individual regeneration
-            for idx, (df_idx, row) in enumerate(profiles_with_emails.iterrows()):
-                with st.expander(f"📧 {row['name']} - {row['company']}", expanded=False):
+            # Email preview and individual regeneration - read just the displayed
+            # columns once instead of building a Series per row
+            names = profiles_with_emails['name'].to_numpy()
+            companies = profiles_with_emails['company'].to_numpy()
+            drafts = profiles_with_emails['draft'].to_numpy()
+            df_indices = profiles_with_emails.index.to_numpy()
+            
+            # Only render one page of expanders per rerun
+            page_count = math.ceil(len(df_indices) / EMAIL_PAGE_SIZE)
+            page = 1
+            if page_count > 1:
+                page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key="email_preview_page")
+            page_start = (page - 1) * EMAIL_PAGE_SIZE
+            
+            for i in range(page_start, min(page_start + EMAIL_PAGE_SIZE, len(df_indices))):
+                df_idx, name = df_indices[i], names[i]
+                with st.expander(f"📧 {name} - {companies[i]}", expanded=False):
                     col1, col2 = st.columns([3, 1])
                     
                     with col1:
                         st.write("**Current Email Draft:**")
-                        email_content = row['draft']
+                        email_content = drafts[i]
                         st.text_area(
                             "Email Content", 
                             value=email_content,
@@ -1128,6 +1422,8 @@ class StreamlitApp:
                             key=f"email_content_{df_idx}",
                             disabled=True
                         )
+                        # A regenerated draft streams in here as it is written
+                        regenerated_area = st.container()
                     
                     with col2:
                         st.write("**Actions:**")
@@ -1138,43 +1434,54 @@ class StreamlitApp:
                             key=f"regenerate_{df_idx}",
                             help="Generate a new email using the latest AI model"
                         ):
-                            with st.spinner(f"Regenerating email for {row['name']}..."):
+                            with st.spinner(f"Regenerating email for {name}..."):
                                 try:
-                                    # Use the profile data from the row
-                                    profile_data = row.to_dict()
-                                    new_email = self.processor.regenerate_email(profile_data, df_idx, config)
+                                    # Only build the full profile for the row that was clicked
+                                    profile_data = profiles_with_emails.iloc[i].to_dict()
+                                    new_email = self.processor.regenerate_email(
+                                        profile_data, df_idx, config, stream_to=regenerated_area
+                                    )
+                                    _fetch_profiles_cached.clear()
                                     
-                                    st.success(f"✅ Email regenerated for {row['name']}!")
-                                    st.info("🔄 Page will refresh to show the new email")
-                                    time.sleep(1)
+                                    # Toasts survive the rerun, so refresh straight away
+                                    st.toast(f"Email regenerated for {name}!", icon="✅")
                                     st.rerun()
                                     
                                 except Exception as e:
                                     st.error(f"❌ Failed to regenerate email: {str(e)}")
                         
-                        # Copy email button
-                        if st.button(
-                            "📋 Copy Email", 
-                            key=f"copy_{df_idx}",
-                            help="Copy email content to clipboard"
-                        ):
-                            # Show the email content in a code block for easy copying
-                            st.code(email_content, language="text")
-                            st.info("📋 Email content displayed above - select and copy")
+                        # Copy email button - copies in the browser, without a rerun
+                        components.html(
+                            '<button title="Copy email content to clipboard" '
+                            f'onclick="navigator.clipboard.writeText({html.escape(json.dumps(str(email_content)))})">'
+                            '📋 Copy Email</button>',
+                            height=45
+                        )
         
         with tab2:
             # Bulk actions
             st.write("**Bulk Email Management**")
             
+            # Build the option labels in one pass instead of two .loc lookups per option
+            labels = dict(zip(
+                profiles_with_emails.index.tolist(),
+                (profiles_with_emails['name'].astype(str) + ' - ' + profiles_with_emails['company'].astype(str)).tolist()
+            ))
+            
             # Select profiles for bulk regeneration
             selected_profiles = st.multiselect(
                 "Select profiles to regenerate emails:",
-                options=profiles_with_emails.index.tolist(),
-                format_func=lambda x: f"{profiles_with_emails.loc[x, 'name']} - {profiles_with_emails.loc[x, 'company']}",
+                options=list(labels),
+                format_func=labels.__getitem__,
                 key="bulk_regenerate_selection"
             )
             
             if selected_profiles:
+                batch_mode = st.toggle(
+                    "⚡ Batch mode (50% cost, up to 24h)",
+                    help="Submit the selected emails as one OpenAI Batch API job instead of regenerating them in real time"
+                )
+                
                 col1, col2 = st.columns([1, 1])
                 
                 with col1:
@@ -1183,43 +1490,65 @@ class StreamlitApp:
                         type="primary",
                         help="Regenerate emails for all selected profiles"
                     ):
-                        # Show cost estimation for bulk regeneration
-                        estimated_cost = len(selected_profiles) * 0.01  # Rough estimate
-                        st.info(f"💰 Estimated cost: ~${estimated_cost:.3f}")
+                        # One frame-level conversion instead of a Series per row. Every column
+                        # except the old draft can feed the prompt as additional information
+                        selected_data = profiles_with_emails.loc[selected_profiles].drop(columns='draft').to_dict('index')
+                        if batch_mode:
+                            # Batch API jobs are billed at half the regular rate
+                            estimated_cost = len(selected_profiles) * 0.005  # Rough estimate
+                            st.info(f"💰 Estimated cost: ~${estimated_cost:.3f}")
+                            try:
+                                batch_id = self.processor.submit_regeneration_batch(selected_data, config)
+                                st.success(f"✅ Submitted batch `{batch_id}` for {len(selected_profiles)} emails. "
+                                           "Use **Check Batch Status** under Pending Batch Jobs to apply the results when it finishes.")
+                            except Exception as e:
+                                st.error(f"❌ Failed to submit batch: {str(e)}")
+                        else:
+                            # Show cost estimation for bulk regeneration
+                            estimated_cost = len(selected_profiles) * 0.01  # Rough estimate
+                            st.info(f"💰 Estimated cost: ~${estimated_cost:.3f}")
                         
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
+                            progress_bar = st.progress(0)
+                            status_text = st.empty()
                         
-                        successful = 0
-                        failed = 0
+                            # Redraw at most ~100 times however many emails are selected
+                            total = len(selected_profiles)
+                            tick = max(1, total // 100)
                         
-                        for i, df_idx in enumerate(selected_profiles):
-                            profile_data = profiles_with_emails.loc[df_idx].to_dict()
-                            profile_name = profile_data.get('name', 'Unknown')
-                            
-                            status_text.text(f"Regenerating email for {profile_name}...")
-                            
-                            try:
-                                self.processor.regenerate_email(profile_data, df_idx, config)
-                                successful += 1
-                                
-                            except Exception as e:
-                                failed += 1
-                                st.error(f"❌ Failed to regenerate email for {profile_name}: {str(e)}")
-                            
-                            # Update progress
-                            progress_bar.progress((i + 1) / len(selected_profiles))
+                            def update_progress(done: int):
+                                if done % tick and done != total:
+                                    return
+                                progress_bar.progress(done / total)
+                                status_text.text(f"Regenerated {done} of {total} emails...")
+                        
+                            # Emails are regenerated concurrently, bounded by Max Workers
+                            status_text.text(f"Regenerating {len(selected_profiles)} emails...")
+                            results = self.processor.regenerate_emails(
+                                selected_data,
+                                config,
+                                on_progress=update_progress
+                            )
                         
-                        status_text.text(f"Completed! {successful} successful, {failed} failed")
+                            successful = 0
+                            failed = 0
+                            for df_idx, result in results.items():
+                                if isinstance(result, Exception):
+                                    failed += 1
+                                    profile_name = profiles_with_emails.loc[df_idx].get('name', 'Unknown')
+                                    st.error(f"❌ Failed to regenerate email for {profile_name}: {str(result)}")
+                                else:
+                                    successful += 1
                         
-                        if successful > 0:
-                            st.success(f"✅ Successfully regenerated {successful} emails!")
-                            st.balloons()
+                            status_text.text(f"Completed! {successful} successful, {failed} failed")
+                        
+                            if successful > 0:
+                                _fetch_profiles_cached.clear()
                             
-                        if failed == 0:
-                            st.info("🔄 Page will refresh to show updated emails")
-                            time.sleep(2)
-                            st.rerun()
+                            if failed == 0:
+                                st.toast(f"Successfully regenerated {successful} emails!", icon="✅")
+                                st.rerun()
+                            elif successful > 0:
+                                st.success(f"✅ Successfully regenerated {successful} emails!")
                 
                 with col2:
                     if st.button(
@@ -1228,7 +1557,7 @@ class StreamlitApp:
                     ):
                         preview_df = profiles_with_emails.loc[selected_profiles][['name', 'company', 'role']]
                         st.dataframe(preview_df, use_container_width=True)
-
+            
 
 def main():
     """Application entry point."""
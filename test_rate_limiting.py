@@ -3,45 +3,80 @@
 Test script for rate limiting functionality
 """
 
-import time
+from unittest import mock
 from ai_service import RateLimiter
 
 def test_rate_limiter():
     """Test the rate limiter functionality."""
     print("🧪 Testing Rate Limiter...")
-    
-    # Test with very low limit for quick testing
-    rate_limiter = RateLimiter(openai_rpm_limit=3)  # 3 requests per minute
-    
-    print(f"OpenAI RPM Limit: {rate_limiter.openai_rpm_limit}")
-    print(f"Perplexity RPM Limit: {rate_limiter.perplexity_rpm_limit}")
-    
-    # Test OpenAI rate limiting
-    print("\n📊 Testing OpenAI rate limiting...")
-    for i in range(5):
-        if rate_limiter.can_make_request("openai"):
-            rate_limiter.record_request("openai")
-            print(f"✅ Request {i+1}: Allowed")
-        else:
-            print(f"❌ Request {i+1}: Rate limited")
-            
-        # Small delay to prevent instant execution
-        time.sleep(0.1)
-    
-    # Test waiting for rate limit
-    print(f"\n⏳ Current OpenAI requests in queue: {len(rate_limiter.openai_request_times)}")
-    print("Testing wait_for_rate_limit (should wait if needed)...")
-    
-    start_time = time.time()
-    rate_limiter.wait_for_rate_limit("openai")
-    wait_time = time.time() - start_time
-    
-    if wait_time > 0.5:
+
+    # Drive the limiter from a fake clock so waits are checked exactly without real sleeps
+    clock = [0.0]
+    def fake_sleep(seconds):
+        clock[0] += seconds
+
+    with mock.patch("ai_service.time.monotonic", lambda: clock[0]), \
+         mock.patch("ai_service.time.sleep", fake_sleep):
+        # Test with very low limit for quick testing
+        rate_limiter = RateLimiter(openai_rpm_limit=3)  # 3 requests per minute
+
+        print(f"OpenAI RPM Limit: {rate_limiter.openai_rpm_limit}")
+        print(f"Perplexity RPM Limit: {rate_limiter.perplexity_rpm_limit}")
+
+        # Test OpenAI rate limiting
+        print("\n📊 Testing OpenAI rate limiting...")
+        allowed = 0
+        for i in range(5):
+            if rate_limiter.can_make_request("openai"):
+                rate_limiter.record_request("openai")
+                allowed += 1
+                print(f"✅ Request {i+1}: Allowed")
+            else:
+                print(f"❌ Request {i+1}: Rate limited")
+
+            # Requests arrive 0.1s apart
+            clock[0] += 0.1
+
+        assert allowed == 3
+
+        # Test waiting for rate limit
+        print(f"\n⏳ Current OpenAI requests in queue: {len(rate_limiter.openai_request_times)}")
+        print("Testing wait_for_rate_limit (should wait if needed)...")
+
+        start_time = clock[0]
+        rate_limiter.wait_for_rate_limit("openai")
+        wait_time = clock[0] - start_time
+
+        # The oldest request was made at t=0, so a slot opens at t=60
+        assert abs(wait_time - (60 - start_time)) < 1e-9
+        assert rate_limiter.can_make_request("openai")
         print(f"✅ Rate limiter waited {wait_time:.2f} seconds as expected")
-    else:
-        print(f"✅ No wait needed ({wait_time:.2f} seconds)")
-    
+
     print("\n🎉 Rate limiting test completed!")
 
+def test_rate_limiter_waits_only_for_oldest_request():
+    """A full window frees up when its oldest request expires, not a whole minute later."""
+    clock = [0.0]
+    def fake_sleep(seconds):
+        clock[0] += seconds
+
+    with mock.patch("ai_service.time.monotonic", lambda: clock[0]), \
+         mock.patch("ai_service.time.sleep", fake_sleep):
+        rate_limiter = RateLimiter(openai_rpm_limit=30)
+
+        # 30 requests spread one per second fill the window
+        for _ in range(30):
+            rate_limiter.acquire("openai")
+            clock[0] += 1.0
+        assert not rate_limiter.can_make_request("openai")
+
+        # At t=30 the first request (t=0) expires at t=60
+        rate_limiter.acquire("openai")
+        assert abs(clock[0] - 60.0) < 1e-9
+        assert len(rate_limiter.openai_request_times) == 30
+
+    print("✅ Full window waited only for the oldest request to expire")
+
 if __name__ == "__main__":
-    test_rate_limiter() 
\ No newline at end of file
+    test_rate_limiter()
+    test_rate_limiter_waits_only_for_oldest_request()